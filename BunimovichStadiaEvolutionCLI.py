@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Stadia evolution runner for the command line. Takes every argument of
+Plotter.plotter as an option, so it runs without a display and without the
+limits of the drop-down lists of the GUI. A file of jobs, one command line per
+line, can be run one job after another or several at once. Uses Plotter.py
+and ResultCache.py.
+
+Examples:
+    python BunimovichStadiaEvolutionCLI.py --const theta --param 0.4 \\
+        --low 0.1 --high 0.2 --samples 50000 --iterations 40 --plot-type cs
+    python BunimovichStadiaEvolutionCLI.py --jobs jobs.txt --parallel 4
+"""
+import matplotlib
+# Draw without a display.
+matplotlib.use("Agg")
+import argparse
+import math
+import os
+import shlex
+import subprocess
+import sys
+import time
+import traceback
+from ComputeIteration import SAMPLETYPES
+from Plotter import plotter, RASTERDPI, MOVIEWRITERS
+from ResultCache import ResultCache
+
+# This script, run again for every job of a parallel batch.
+SCRIPT = os.path.abspath(__file__)
+
+def makeParser():
+    """ Returns the argparse parser of the command line options.
+    """
+    parser = argparse.ArgumentParser( \
+        description="Plots the evolution of collision points in a "
+                    "Bunimovich stadium without the GUI.")
+    job = parser.add_argument_group("job")
+    job.add_argument("--const", choices=["theta", "phi"], \
+                     help="the constant variable")
+    job.add_argument("--param", type=float, \
+                     help="the value of the constant variable")
+    job.add_argument("--low", type=float, \
+                     help="lower bound of the sampled variable")
+    job.add_argument("--high", type=float, \
+                     help="upper bound of the sampled variable")
+    job.add_argument("--samples", type=int, default=100, \
+                     help="number of samples (default 100)")
+    job.add_argument("--iterations", type=int, default=10, \
+                     help="number of iterations of the collision map; pages "
+                          "are drawn for iterations start to iterations-1 "
+                          "(default 10)")
+    job.add_argument("--start", type=int, default=0, \
+                     help="first iteration drawn (default 0)")
+    job.add_argument("--lam", type=float, default=2, \
+                     help="ratio of the stadium's side to its radius "
+                          "(default 2)")
+    job.add_argument("--sample-type", default="even", \
+                     choices=SAMPLETYPES, \
+                     help="sampling technique (default even)")
+    job.add_argument("--seed", type=int, \
+                     help="seed of the random and stratified sampling "
+                          "techniques")
+    job.add_argument("--plot-type", default="csb", type=plotType, \
+                     help="views to draw, any of c (cylinder), s (sphere) "
+                          "and b (stadia) (default csb)")
+    job.add_argument("--workers", type=int, default=1, \
+                     help="processes computing the trajectories (default 1)")
+    job.add_argument("--page-workers", type=int, default=1, \
+                     help="processes drawing the pages (default 1)")
+    job.add_argument("--output", default="pdf", \
+                     choices=["pdf", "rasterpdf", "png"] + \
+                             sorted(MOVIEWRITERS), \
+                     help="how the pages are written (default pdf)")
+    job.add_argument("--dpi", type=int, default=RASTERDPI, \
+                     help="resolution of rasterized output (default " + \
+                          str(RASTERDPI) + ")")
+    job.add_argument("--cache", metavar="DIRECTORY", \
+                     help="keep the trajectories in this directory and "
+                          "reuse them in later runs")
+    batch = parser.add_argument_group("batch")
+    batch.add_argument("--jobs", metavar="FILE", \
+                       help="run the jobs in FILE instead, one line of job "
+                            "options per job; # starts a comment")
+    batch.add_argument("--parallel", type=int, default=1, \
+                       help="number of jobs of FILE run at once (default 1)")
+    return parser
+
+def plotType(text):
+    """ Checks the value of --plot-type.
+    """
+    if not text or any(view not in "csb" for view in text):
+        raise argparse.ArgumentTypeError("use any of the letters c, s and b")
+    return text
+
+def checkJob(parser, args):
+    """ Stops with an error message if a job option without a default is
+        missing or if an option is out of range. The ranges are those the
+        GUI enforces.
+    """
+    for option in ("const", "param", "low", "high"):
+        if getattr(args, option) is None:
+            parser.error("--" + option + " is required")
+    if args.samples < 1:
+        parser.error("--samples must be at least 1")
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+    if not 0 <= args.start < args.iterations:
+        parser.error("--start must be at least 0 and less than --iterations")
+    if args.lam <= 0:
+        parser.error("--lam must be positive")
+    if args.low > args.high:
+        parser.error("--low must not be greater than --high")
+    if args.const == "phi" and abs(args.param) >= math.pi/2:
+        parser.error("phi (--param) must be inside (-pi/2, pi/2)")
+    if args.const == "theta" and \
+       (args.low <= -math.pi/2 or args.high >= math.pi/2):
+        parser.error("phi (--low to --high) must be inside (-pi/2, pi/2)")
+    for option in ("workers", "page_workers", "dpi"):
+        if getattr(args, option) < 1:
+            parser.error("--" + option.replace("_", "-") + \
+                         " must be at least 1")
+
+def runJob(args):
+    """ Runs the job given by the parsed options.
+    """
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(directory=args.cache)
+    plotter(args.const, args.samples, args.low, args.high, args.param, \
+            args.iterations, args.start, args.lam, args.sample_type, \
+            args.plot_type, seed=args.seed, workers=args.workers, \
+            cache=cache, pageWorkers=args.page_workers, output=args.output, \
+            dpi=args.dpi)
+
+def readJobs(parser, filename):
+    """ Returns the list of the command lines (as lists of arguments) in the
+        file of jobs. Every job is parsed first so that a mistake on any
+        line stops the batch before it starts.
+    """
+    jobs = []
+    with open(filename) as lines:
+        for line in lines:
+            arguments = shlex.split(line, comments=True)
+            if not arguments:
+                continue
+            args = parser.parse_args(arguments)
+            if args.jobs is not None:
+                parser.error("a job cannot run another file of jobs")
+            checkJob(parser, args)
+            jobs.append(arguments)
+    return jobs
+
+def runJobs(parser, filename, parallel):
+    """ Runs every job of the file. With parallel above one, each job runs
+        in its own Python process, so that jobs can still use workers of
+        their own, and at most 'parallel' of them run at the same time.
+        A job that fails does not stop the others. Returns the number of
+        jobs that failed.
+    """
+    jobs = readJobs(parser, filename)
+    failed = 0
+    if parallel <= 1:
+        for arguments in jobs:
+            print "Running: " + " ".join(arguments)
+            try:
+                runJob(parser.parse_args(arguments))
+            except Exception:
+                # Go on with the other jobs, as a parallel batch does.
+                traceback.print_exc()
+                failed = failed + 1
+        return failed
+    running = []
+    while jobs or running:
+        # Start jobs while there is room.
+        while jobs and len(running) < parallel:
+            arguments = jobs.pop(0)
+            print "Starting: " + " ".join(arguments)
+            running.append(subprocess.Popen([sys.executable, SCRIPT] + \
+                                            arguments))
+        time.sleep(0.1)
+        for process in [p for p in running if p.poll() is not None]:
+            running.remove(process)
+            if process.returncode != 0:
+                failed = failed + 1
+    return failed
+
+def main(argv=None):
+    """ Runs the command line argv, by default the one this script was
+        started with.
+    """
+    parser = makeParser()
+    args = parser.parse_args(argv)
+    if args.jobs is not None:
+        failed = runJobs(parser, args.jobs, args.parallel)
+        if failed:
+            print str(failed) + " job(s) failed."
+            return 1
+        return 0
+    checkJob(parser, args)
+    runJob(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
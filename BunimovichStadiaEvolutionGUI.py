@@ -10,43 +10,22 @@ and Spherical View. Uses Plotter.py
 import Tkinter as tk
 from Tkinter import StringVar, Label, Entry, OptionMenu, Menu, Message, Button
 from MessageText import TEXT, ITERMESSAGE, PHIMESSAGE1, PHIMESSAGE2
-from Plotter import plotter
+from Plotter import plotInBackground
+from ResultCache import ResultCache
 from CoordinateConversion import mod2pi
+from multiprocessing import Process, Queue, freeze_support
+import Queue as queues
+import atexit
 import math
+import shutil
+import tempfile
 
 pi = math.pi
 
-# Create a GUI window
-master = tk.Tk()
-
-## Create global variables (those in drop down menus) ##
-constvar   = StringVar(master) # Which variable (theta/phi) is constant?
-eRange     = StringVar(master) # Specifies a window for the other var to vary
-samples    = StringVar(master) # Specifies the number of samples
-sampleType = StringVar(master) # Specifies the sampling technique to be used
-iterations = StringVar(master) # Specifies the number of iterations
-start      = StringVar(master) # Specifies the iteration to start displaying
-
-## Global entry variables
-const = StringVar(master)
-var   = StringVar(master)
-
-## Global check box variables
-c_check = StringVar()
-s_check = StringVar()
-b_check = StringVar()
-
-# Set default values for the global variables (displayed on drop-downs)
-constvar.set("constant variable")
-eRange.set("sampled variable range")
-samples.set("samples")
-sampleType.set("sample method")
-iterations.set("iterations")
-start.set("first iteration")
-# Make sure check boxes start unchecked
-c_check.set(0)
-s_check.set(0)
-b_check.set(0)
+# The process making the plots and the queue it reports its progress on.
+# worker is None when no plot is being made.
+worker = None
+messages = None
 
 ## A function for displaying the "about" information under the help menu ##
 ## This uses the variable TEXT imported from helpAboutText.py ##
@@ -86,7 +65,9 @@ def protectGenerate(*args):
     g = const.get()
     h = var.get()
     i = c_check.get() == '1' or s_check.get() == '1' or b_check.get() == '1'
-    if a and b and c and d and e and f and g and h and i:
+    # Only one plot is made at a time.
+    j = worker is None
+    if a and b and c and d and e and f and g and h and i and j:
         generate_button.config(state = 'normal')
     else:
         generate_button.config(state = 'disabled')
@@ -181,8 +162,57 @@ def generate():
         text.pack()
         return False
     
-    if plotter(cvar, sams, avg - epsi, avg + epsi, para, its+1, star, 2, \
-                    styp, c + s + b):
+    startPlotting((cvar, sams, avg - epsi, avg + epsi, para, its+1, star, 2, \
+                   styp, c + s + b))
+
+## A function for making the plots in a background process so that the ##
+## window stays responsive ------------------------------------------- ##
+def startPlotting(args):
+    global worker, messages
+    messages = Queue()
+    worker = Process(target = plotInBackground, \
+                     args = (messages, args, {"cache": cache}))
+    # Do not outlive the GUI.
+    worker.daemon = True
+    worker.start()
+    status.set("Starting...")
+    finished.set("")
+    generate_button.config(state = 'disabled')
+    cancel_button.config(state = 'normal')
+    master.after(100, poll)
+
+## A function for showing the progress of the plotting process. It is ##
+## called every 100ms until the process is done --------------------- ##
+def poll():
+    global worker
+    if worker is None:
+        # The plotting was cancelled.
+        return
+    done = False
+    try:
+        while True:
+            (kind, text) = messages.get_nowait()
+            if kind == "progress":
+                status.set(text)
+            elif kind == "view":
+                # Show every output as soon as it is written.
+                finished.set(finished.get() + "Written: " + text + "\n")
+            elif kind == "done":
+                done = True
+            elif kind == "error":
+                print text
+                status.set("Plotting failed, see the console.")
+    except queues.Empty:
+        pass
+    if worker.is_alive() or not messages.empty():
+        master.after(100, poll)
+        return
+    worker.join()
+    worker = None
+    cancel_button.config(state = 'disabled')
+    protectGenerate()
+    if done:
+        status.set("Done.")
         confirm_window = tk.Toplevel(master) 
         confirm_window.geometry("200x100")
         confirm_window.title("Success!")
@@ -193,11 +223,73 @@ def generate():
         """
         text = Message(confirm_window, text = msg, padx = 10)
         text.pack()
+    elif not status.get().startswith("Plotting failed"):
+        status.set("Plotting stopped unexpectedly.")
+
+## A function for stopping the plotting process ##
+def cancel():
+    global worker
+    if worker is not None:
+        worker.terminate()
+        worker.join()
+        worker = None
+    status.set("Cancelled.")
+    cancel_button.config(state = 'disabled')
+    protectGenerate()
 
 if __name__ == "__main__":
+    # On Windows the plotting process starts by importing this file again,
+    # and a frozen executable starts itself again. Everything below must
+    # only happen in the process the user started.
+    freeze_support()
+    
+    # Trajectories computed during this session. Replotting the same
+    # parameters (e.g. a different view or start) does not iterate the
+    # collision map again. The plots are made in another process, so the
+    # trajectories are kept in a directory which is removed when the
+    # session ends.
+    cacheDirectory = tempfile.mkdtemp(prefix="stadia")
+    atexit.register(shutil.rmtree, cacheDirectory, True)
+    cache = ResultCache(directory=cacheDirectory)
+
+    # Create a GUI window
+    master = tk.Tk()
+
+    ## Create global variables (those in drop down menus) ##
+    constvar   = StringVar(master) # Which variable (theta/phi) is constant?
+    eRange     = StringVar(master) # A window for the other var to vary
+    samples    = StringVar(master) # Specifies the number of samples
+    sampleType = StringVar(master) # The sampling technique to be used
+    iterations = StringVar(master) # Specifies the number of iterations
+    start      = StringVar(master) # The first iteration to display
+
+    ## Global entry variables
+    const = StringVar(master)
+    var   = StringVar(master)
+
+    ## Global check box variables
+    c_check = StringVar()
+    s_check = StringVar()
+    b_check = StringVar()
+
+    ## Global status variables
+    status   = StringVar(master) # What the plotting process is doing
+    finished = StringVar(master) # The outputs written so far
+
+    # Set default values for the global variables (displayed on drop-downs)
+    constvar.set("constant variable")
+    eRange.set("sampled variable range")
+    samples.set("samples")
+    sampleType.set("sample method")
+    iterations.set("iterations")
+    start.set("first iteration")
+    # Make sure check boxes start unchecked
+    c_check.set(0)
+    s_check.set(0)
+    b_check.set(0)
     
     # Set the size of the GUI window
-    master.geometry("460x285")
+    master.geometry("460x400")
     master.title("Bunimovich Stadia Evolution Viewer")
     
     ## Create a Menu ##
@@ -250,7 +342,7 @@ if __name__ == "__main__":
     eRang_list = ["pi/4", "pi/16", "pi/64", "pi/256", "pi/1024"]
     samples_list = ["2", "5", "10", "20", "50", "100", "200", "500", "1000",\
                      "2000",  "5000",  "10000"]
-    samType_list = ["even", "random"]
+    samType_list = ["even", "random", "halton", "stratified", "adaptive"]
     iterations_list = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", \
                        "11", "12", "13", "14", "15"]
     start_list = ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", \
@@ -309,4 +401,16 @@ if __name__ == "__main__":
     s_checkbutton.grid(row = 9, column = 1)
     b_checkbutton.grid(row = 9, column = 2)
     
+    ## Show the progress of the plotting and allow cancelling it ##
+    cancel_button = Button(master, text = "Cancel", command = cancel)
+    cancel_button.config(state = 'disabled')
+    status_label = Label(master, textvariable = status)
+    finished_label = Label(master, textvariable = finished, \
+                           justify = tk.LEFT, wraplength = 440)
+    
+    # Place the progress widgets
+    status_label.grid(row = 10, column = 0, columnspan = 2)
+    cancel_button.grid(row = 10, column = 2)
+    finished_label.grid(row = 11, column = 0, columnspan = 3)
+    
     master.mainloop()
\ No newline at end of file
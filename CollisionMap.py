@@ -9,420 +9,832 @@ CoordinateConversion.py.
 """
 
 import math
-from CoordinateConversion import mod2pi
+import numpy as np
+from CoordinateConversion import mod2pi, mod2piArray
 
-def collisionLoop(x, y, beta, iterations, lam):
-    """ Calls the collision map 'iterations' times on the initial condition 
-        (x,y,b). Each calculated collision is saved in a list which is returned
-        by this function.
+class Stadium(object):
+    """ lam     := the ratio of twice the length of the billiard table to its
+                   radius.
+        epsilon := the error tolerance used when comparing two "equal" values.
+        delta   := the tolerance used to detect a vertical path.
+        A Bunimovich stadium. Carries everything the collision map needs to
+        know about the table so that stadia with different values of lam can
+        be used at the same time, for example from different threads.
     """
-    # This value sets an error tolerance when comparing two "equal" values
-    global epsilon
-    epsilon = math.pow(10,-7)
-    global delta
-    delta = math.pow(10,-6)
-    
-    # This value is used frequently in most of the functions.
-    global halfLam
-    halfLam = float(lam)/2     
-       
-    points = [(x,y,beta)]
+    def __init__(self, lam, epsilon=math.pow(10,-7), delta=math.pow(10,-6)):
+        self.lam = lam
+        self.epsilon = epsilon
+        self.delta = delta
+        # This value is used frequently in most of the methods.
+        self.halfLam = float(lam)/2
+
+    def collisionLoop(self, x, y, beta, iterations):
+        """ Calls the collision map 'iterations' times on the initial 
+            condition (x,y,b). Each calculated collision is saved in a list 
+            which is returned by this method.
+        """
+        points = [(x,y,beta)]
     
-    # Iteratively call the collision map. Save the collision points returned.
-    while iterations > 0:
-        (x,y,beta) = collisionMap(x,y,beta)
-        points.append((x,y,beta))
-        iterations = iterations - 1
+        # Iteratively call the collision map. Save the collision points
+        # returned.
+        while iterations > 0:
+            (x,y,beta) = self.collisionMap(x,y,beta)
+            points.append((x,y,beta))
+            iterations = iterations - 1
         
-    return points
+        return points
 
-def collisionMap(x,y,beta):
-    """ Calculates the next collision given the previous collision specified
-        by x,y,beta. The next collision is returned as x1,y1,b1. This function
-        uses the 4 boolean flags described below.
-    """
-    # ::The COLLISION variable::
-    # This variable indicates where the previous collision was, within the 
-    # collision testers it is set to where the collision is. The key describing
-    # the values for this variable and what they mean are as follows:
-    # 0 indicates that the variable has just been reset/ collision location
-    # unknown.
-    # 1 indicates that the collision was with the left cap.
-    # 2 indicates that the collision was with the upper side.
-    # 3 indicates that the collision was with the right cap.
-    # 4 indicates that the collision was with the lower side.
-    # Set the variable to zero to indicate that the location of the previous
-    # collision is unknown.
-    collision = 0
-    
-    beta = mod2pi(beta)
-    
-    # Check for the special case where the billiard is traveling horizontally.
-    if beta == 0 or beta == math.pi:
-        return horizontalPath(x,y,beta)
-    
-    # Check for the special case where the billiard is traveling vertically.
-    if abs(beta - math.pi/2) < delta or abs(beta - 3*math.pi/2) < delta:
-        return verticalPath(x,y,beta)
-    
-    # See which part of the billiard table the initial condition (a collision) 
-    # resides. Then set collision to the appropriate value.    
-    # See which part of the table the initial condition resides.
-    if x < -halfLam:
-        # left cap.
-        collision = 1
-    elif x <= halfLam:
-        if y > 0:
-            # Upper side.
-            collision = 2
-        if y < 0:
-            # Lower side.
-            collision = 4
-    else:
-        # right cap.
-        collision = 3    
+    def collisionMap(self, x,y,beta):
+        """ Calculates the next collision given the previous collision 
+            specified by x,y,beta. The next collision is returned as x1,y1,b1. 
+            This function uses the 4 boolean flags described below.
+        """
+        halfLam = self.halfLam
+        delta = self.delta
+        # ::The COLLISION variable::
+        # This variable indicates where the previous collision was, within the
+        # collision testers it is set to where the collision is. The key
+        # describing the values for this variable and what they mean are as
+        # follows:
+        # 0 indicates that the variable has just been reset/ collision location
+        # unknown.
+        # 1 indicates that the collision was with the left cap.
+        # 2 indicates that the collision was with the upper side.
+        # 3 indicates that the collision was with the right cap.
+        # 4 indicates that the collision was with the lower side.
+        # Set the variable to zero to indicate that the location of the
+        # previous collision is unknown.
+        collision = 0
+    
+        beta = mod2pi(beta)
+    
+        # Check for the special case where the billiard is traveling
+        # horizontally.
+        if beta == 0 or beta == math.pi:
+            return self.horizontalPath(x,y,beta)
+    
+        # Check for the special case where the billiard is traveling
+        # vertically.
+        if abs(beta - math.pi/2) < delta or abs(beta - 3*math.pi/2) < delta:
+            return self.verticalPath(x,y,beta)
+    
+        # See which part of the billiard table the initial condition (a
+        # collision) resides. Then set collision to the appropriate value.
+        # See which part of the table the initial condition resides.
+        if x < -halfLam:
+            # left cap.
+            collision = 1
+        elif x <= halfLam:
+            if y > 0:
+                # Upper side.
+                collision = 2
+            if y < 0:
+                # Lower side.
+                collision = 4
+        else:
+            # right cap.
+            collision = 3    
        
-    if not collision == 2 :
-        # Run collision test for upper side.
-        point = upperSideCollisionTest(x,y,beta)
-        if point != None:
-            return point
+        # Compute the slope of the billiard's path and the components of its
+        # velocity vector once. They are shared by all of the collision tests.
+        m = math.tan(beta)
+        vx = math.cos(beta)
+        vy = math.sin(beta)
     
-    if not collision == 4:
-        # Run collision test for lower side.
-        point = lowerSideCollisionTest(x,y,beta)
-        if point != None:
-            return point
- 
-    point = leftCapCollisionTest(x,y,beta, collision)
-    if point != None:
-        return point
- 
-    point = rightCapCollisionTest(x,y,beta, collision)
-    if point != None:
-        return point
-    
-    print "The collision map did not detect a collision for the input: "
-    print "[x,y,beta] = " + str([x,y,beta])
-    return (0,0,0)
-###################################################END Collision Map##########
-    
-
-def upperSideCollisionTest(x,y,beta):
-    """ This function checks for a collision with the upper side. If one is
-        detected, then calculate the coordinates where it occurs and the 
-        billiard's new direction. The input is the coordinate of the billiard's
-        previous collision along with the slope of the line representing the
-        path. The coordinates of the new collision are returned along with the
-        angle specifying the direction. If no collision was detected then None
-        is returned.
-    """
-    # Set the slope of the line representing the path of the billiard.
-    m = math.tan(beta)
-    # See where the billiard's path intersects the line y=1.
-    # If this occurs in the proper range then a collision with
-    # the upper side has occurred.
-    intersection = (1-float(y))/m + x
-    if -halfLam <= intersection and intersection <= halfLam:
-        x1 = intersection
-        y1 = 1
-        # find the components of the post-collisional velocity vector.
-        vpx = math.cos(beta)
-        vpy = -math.sin(beta)
-        # use the post collisional velocity vector to find the new direction 
-        # angle
-        beta1 = math.atan2(vpy,vpx)
-        return (x1, y1, mod2pi(beta1))
-    return None
-
-##############################################END upperSideCollisionTest()####
-    
-def lowerSideCollisionTest(x,y,beta):
-    """ Tests for collision with LS. IF one occurs return the new collisions 
-        coordinates with the billiards new direction. Otherwise return None.
-    """
-    # Set the slope of the line representing the path of the billiard.
-    m = math.tan(beta)
-    # See where the billiard's path intersects the line y=1.
-    # If this occurs in the proper range then a collision with
-    # the upper side has occurred.
-    intersection = (-1-float(y))/m + x
-    if -halfLam <= intersection and intersection <= halfLam:
-        x1 = intersection
-        y1 = -1
-        # find the components of the post-collisional velocity vector.
-        vpx = math.cos(beta)
-        vpy = -math.sin(beta)
-        # use the post collisional velocity vector to find the new direction 
-        # angle
-        beta1 = math.atan2(vpy,vpx)
-        return (x1, y1, mod2pi(beta1))
-    return None
-
-############################################END lowerSideCollisoinTest()######
-    
-def leftCapCollisionTest(x,y,beta,collision):
-    """ Tests for a collision with the upper left cap. If one is detected,
-        the new x,y, and beta-values are computed and returned. If not, then
-        None is returned.
-    """
-    # Set the slope of the line representing the path of the billiard.
-    m = math.tan(beta)
-    # Set variables used to test for a collision
-    mSquare = math.pow(m,2)
-    a = mSquare + 1
-    b = 2*m*y - 2*mSquare*x + 2*halfLam
-    c = mSquare*math.pow(x,2) - 2*m*y*x + math.pow(y,2) \
-        + math.pow(halfLam,2) - 1
-    bSquare = math.pow(b,2)
-    discr = bSquare - 4*a*c
-    # Ensure that the discriminant is non-negative!
-    if discr < 0:
+        # Only test the walls the billiard can reach. A billiard moving up can
+        # not reach the lower side and one moving down can not reach the upper
+        # side. A billiard moving right can only reach the left cap if it is 
+        # already in the left cap, and likewise for one moving left and the 
+        # right cap.
+        if vy > 0 and not collision == 2 :
+            # Run collision test for upper side.
+            point = self.upperSideCollisionTest(x,y,m,vx,vy)
+            if point != None:
+                return point
+    
+        if vy < 0 and not collision == 4:
+            # Run collision test for lower side.
+            point = self.lowerSideCollisionTest(x,y,m,vx,vy)
+            if point != None:
+                return point
+    
+        if vx < 0 or collision == 1:
+            point = self.leftCapCollisionTest(x,y,m,vx,vy, collision)
+            if point != None:
+                return point
+    
+        if vx > 0 or collision == 3:
+            point = self.rightCapCollisionTest(x,y,m,vx,vy, collision)
+            if point != None:
+                return point
+    
+        print "The collision map did not detect a collision for the input: "
+        print "[x,y,beta] = " + str([x,y,beta])
+        return (0,0,0)
+    ###############################################END Collision Map##########
+
+    def upperSideCollisionTest(self, x,y,m,vx,vy):
+        """ This function checks for a collision with the upper side. If one is
+            detected, then calculate the coordinates where it occurs and the 
+            billiard's new direction. The input is the coordinate of the 
+            billiard's previous collision along with the slope of the line 
+            representing the path and the components of the billiard's 
+            velocity vector. The coordinates of the new collision are returned
+            along with the angle specifying the direction. If no collision was
+            detected then None is returned.
+        """
+        halfLam = self.halfLam
+        # See where the billiard's path intersects the line y=1.
+        # If this occurs in the proper range then a collision with
+        # the upper side has occurred.
+        intersection = (1-float(y))/m + x
+        if -halfLam <= intersection and intersection <= halfLam:
+            x1 = intersection
+            y1 = 1
+            # find the components of the post-collisional velocity vector.
+            vpx = vx
+            vpy = -vy
+            # use the post collisional velocity vector to find the new
+            # direction angle
+            beta1 = math.atan2(vpy,vpx)
+            return (x1, y1, mod2pi(beta1))
         return None
-    # 
-    square = math.sqrt(discr)
-    a2 = 2*a
-    # Find the two potential x-values of a collision with the upper left cap.
-    d = (-b + square)/a2
-    e = (-b - square)/a2
-    # See if the previous collision was in the left cap.
-    if collision == 1 :
-        # The previous collision was in the left cap. See which 
-        # potential x-value was the x-value of the previous collision.
-        # The other potential x-value must belong to the new collision.
-        # Set collision to 1  to indicate that a collision with left cap
-        # was detected so that the new y-value and direction can be computed
-        # below.
-        if abs(x-e) < epsilon and d < -halfLam:
-            x1 = d
-            collision = 1
 
-        elif abs(x-d) < epsilon and e < -halfLam:
-            x1 = e
-            collision = 1
+    ##########################################END upperSideCollisionTest()####
+    
+
+    def lowerSideCollisionTest(self, x,y,m,vx,vy):
+        """ Tests for collision with LS. IF one occurs return the new 
+            collisions coordinates with the billiards new direction. Otherwise
+            return None. m is the slope of the billiard's path and (vx,vy) its
+            velocity vector.
+        """
+        halfLam = self.halfLam
+        # See where the billiard's path intersects the line y=1.
+        # If this occurs in the proper range then a collision with
+        # the upper side has occurred.
+        intersection = (-1-float(y))/m + x
+        if -halfLam <= intersection and intersection <= halfLam:
+            x1 = intersection
+            y1 = -1
+            # find the components of the post-collisional velocity vector.
+            vpx = vx
+            vpy = -vy
+            # use the post collisional velocity vector to find the new
+            # direction angle
+            beta1 = math.atan2(vpy,vpx)
+            return (x1, y1, mod2pi(beta1))
+        return None
+
+    ########################################END lowerSideCollisoinTest()######
+    
+
+    def leftCapCollisionTest(self, x,y,m,vx,vy,collision):
+        """ Tests for a collision with the upper left cap. If one is detected,
+            the new x,y, and beta-values are computed and returned. If not, 
+            then None is returned. m is the slope of the billiard's path and 
+            (vx,vy) its velocity vector.
+        """
+        halfLam = self.halfLam
+        epsilon = self.epsilon
+        # Set variables used to test for a collision
+        # Square by multiplying, exactly as the batch versions do.
+        mSquare = m*m
+        a = mSquare + 1
+        b = 2*m*y - 2*mSquare*x + 2*halfLam
+        c = mSquare*(x*x) - 2*m*y*x + y*y + halfLam*halfLam - 1
+        bSquare = b*b
+        discr = bSquare - 4*a*c
+        # Ensure that the discriminant is non-negative!
+        if discr < 0:
+            return None
+        # 
+        square = math.sqrt(discr)
+        a2 = 2*a
+        # Find the two potential x-values of a collision with the upper left
+        # cap.
+        d = (-b + square)/a2
+        e = (-b - square)/a2
+        # See if the previous collision was in the left cap.
+        if collision == 1 :
+            # The previous collision was in the left cap. See which potential
+            # x-value was the x-value of the previous collision.
+            # The other potential x-value must belong to the new collision.
+            # Set collision to 1  to indicate that a collision with left cap
+            # was detected so that the new y-value and direction can be
+            # computed below.
+            if abs(x-e) < epsilon and d < -halfLam:
+                x1 = d
+                collision = 1
+
+            elif abs(x-d) < epsilon and e < -halfLam:
+                x1 = e
+                collision = 1
+            else:
+                # The previous collision was in the upper left cap and the old
+                # x-value does not correspond to one of the solutions of the
+                # billiard's path intersecting the cap.
+                collision = 0
         else:
-            # The previous collision was in the upper left cap and the
-            # old x-value does not correspond to one of the solutions of the
-            # billiard's path intersecting the cap.
-            collision = 0
-    else:
-        # The previous collision was not in the upper left cap. Test potential
-        # x-values to see if they lie on the upper left cap.
-        if -halfLam -1 <= d and d < -halfLam:
-            # A collision was detected, set the new x-value, collision to 1 
-            # so the new y-value and direction can be computed below.
-            x1 = d
-            collision = 1
-        elif -halfLam -1 <= e and e < -halfLam:
-            # A collision was detected, set the new x-value, collision to 1 
-            # so the new y-value and direction can be computed below.
-            x1 = e
-            collision = 1
-    # If a collision was detected we must compute the new y-value and direction
-    # Otherwise we return None as specified.
-    if collision == 1:
+            # The previous collision was not in the upper left cap. Test
+            # potential x-values to see if they lie on the upper left cap.
+            if -halfLam -1 <= d and d < -halfLam:
+                # A collision was detected, set the new x-value, collision to 1 
+                # so the new y-value and direction can be computed below.
+                x1 = d
+                collision = 1
+            elif -halfLam -1 <= e and e < -halfLam:
+                # A collision was detected, set the new x-value, collision to 1 
+                # so the new y-value and direction can be computed below.
+                x1 = e
+                collision = 1
+        # If a collision was detected we must compute the new y-value and
+        # direction Otherwise we return None as specified.
+        if collision == 1:
+            # Set the new y-value
+            y1 = m*(x1 - x) + y
+            # The components of the pre-collisional velocity vector
+            vmx = vx
+            vmy = vy
+            # Calculate the components of the inward normal vector
+            nx = -(x1 + halfLam)
+            ny = -y1
+            # calculate the dot product of the pre-collisional velocity vector
+            # and the inward normal
+            dot = vmx*nx + vmy*ny
+            # Calculate the components of the post-collisional velocity vector
+            vpx = vmx - 2*dot*nx
+            vpy = vmy - 2*dot*ny
+            # Calculate the direction angle of the post-collisional velocity
+            # vector
+            beta1 = math.atan2(vpy, vpx)
+            return (x1, y1, mod2pi(beta1))
+        return None
+
+    #####################################End Left Cap Collision Tester
+
+    def rightCapCollisionTest(self, x,y,m,vx,vy, collision):
+        """ Tests for a collision with the upper right cap. If one is detected,
+            then the new x,y, and beta-values are computed and returned. If 
+            not, then None is returned. m is the slope of the billiard's path
+            and (vx,vy) its velocity vector.
+        """
+        halfLam = self.halfLam
+        epsilon = self.epsilon
+        # Set variables used to test for a collision
+        # Square by multiplying, exactly as the batch versions do.
+        mSquare = m*m
+        a = mSquare + 1
+        b = 2*m*y - 2*mSquare*x - 2*halfLam
+        c = mSquare*(x*x) - 2*m*y*x + y*y + halfLam*halfLam - 1
+        bSquare = b*b
+        discr = bSquare - 4*a*c
+        # Ensure that the discriminant is non-negative!
+        if discr < 0:
+            return None
+        square = math.sqrt(discr)
+        a2 = 2*a
+        # Find the two potential x-values of a collision with the upper right
+        # cap.
+        d = (-b + square)/a2
+        e = (-b - square)/a2
+        # Check if the previous collision was with the upper right cap.
+        if collision == 3:
+            # The previous collision was in the upper right cap. See which
+            # potential x-value was the x-value of the previous collision.
+            # The other potential x-value must belong to the new collision.
+            # Set collision to 3 to indicate that a collision with upper right
+            # cap was detected so that the new y-value and direction can be
+            # computed below.
+            if abs(x-d) < epsilon and e > halfLam:
+                x1 = e
+                collision = 3
+            elif abs(x-e) < epsilon and d > halfLam:
+                x1 = d
+                collision = 3
+            else:
+                # The previous collision was in the upper right cap and the old
+                # x-value does not correspond to one of the solutions of the
+                # billiard's path intersecting the cap.
+                collision = 0
+        else:
+            # The previous collision was not in the right cap. Test the
+            # potential x-values to see if they lie on the right cap.
+            if halfLam <= d and d <= halfLam + 1 + epsilon:
+                # A collision was detected, set the new x-value, collision to 3
+                # so the new y-value and direction can be computed below.
+                x1 = d
+                collision = 3
+            elif halfLam <= e and e <= halfLam + 1 + epsilon:
+                # A collision was detected, set the new x-value, collision to 3 
+                # so the new y-value and direction can be computed below.
+                x1 = e
+                collision = 3
+        # If a collision was detected we must compute the new y-value and
+        # direction Otherwise we return None as specified.
+        if collision == 3:
+    # Set the new y-value
+            y1 = m*(x1 - x) + y
+            # The components of the pre-collisional velocity vector
+            vmx = vx
+            vmy = vy
+            # Calculate the components of the inward normal vector
+            nx = -(x1 - halfLam)
+            ny = -y1
+            # calculate the dot product of the pre-collisional velocity vector
+            # and the inward normal
+            dot = vmx*nx + vmy*ny
+            # Calculate the components of the post-collisional velocity vector
+            vpx = vmx - 2*dot*nx
+            vpy = vmy - 2*dot*ny
+            # Calculate the direction angle of the post-collisional velocity
+            # vector
+            beta1 = math.atan2(vpy, vpx)
+            return (x1, y1, mod2pi(beta1))
+        return None
+
+    #####################################End Right Cap Collision Tester
+
+    def horizontalPath(self, x,y,beta):
+        """ This function calculates the next collision for a particle 
+            traveling in a purely horizontal direction. (the set where this 
+            happens should have a measure of zero)
+        """
+        halfLam = self.halfLam
+        # The billiard is traveling horizontally so the next collision has the 
+        # same y-value and the x-value is reflected about the y-axis.
+        y1 = y
+        x1 = -x
+    
+        # Check for the special case where the billiard is traveling along the
+        # x-axis. If it is it shall bounce back along the same path.
+        if y == 0:
+            if beta == 0:
+                beta1 = math.pi
+            elif beta == math.pi:
+                beta1 = 0
+            return (x1, y1, mod2pi(beta1))
+    
+        # Check if the billiard is traveling from left to right.
+        # Notice that the billiard can not collide with a flat wall because
+        # it is traveling horizontally, which is parallel to the flat walls.
+        if beta == 0:
+            # This is the angle between the billiard's path and the inward
+            # normal.
+            # Since beta is zero, the direction between the path's line and the
+            # inward normal is just the inward normal's angle.
+            alpha = math.acos(x1 - halfLam)
+            # Check if the billiard is traveling towards the upper right cap.
+            if y > 0:
+                # To get the new direction of the billiard we use the
+                # direction of the inward normal and rotate it ccw by alpha.
+                beta1 = math.pi + math.asin(y1) + alpha
+            # Check if the billiard is traveling towards the lower right cap.
+            elif y < 0:
+                # To get the new direction of the billiard we use the direction
+                # of the inward normal and rotate it clockwise by alpha.
+                beta1 = math.pi + math.asin(y1) - alpha
+            # Notice that we don't have to consider the case where y=0 because
+            # it is handled in the first if statement of this function.
+            # Return the new point in the collision space.
+            return (x1, y1, mod2pi(beta1))
+    
+        # Check if the billiard is traveling from right to left.
+        if beta == math.pi:
+            # Find the angle between the billiard's path and the inward normal.
+            alpha = math.acos(-(x1 + halfLam))
+            # Check if the billiard is traveling towards the upper left cap.
+            if y > 0:
+                # To get the new direction of the billiard take the inward
+                # normal's direction and rotate if clockwise by alpha.
+                beta1 = 2*math.pi - math.asin(y1) - alpha
+            # Check if the billiard is traveling towards the lower left cap.
+            if y < 0:
+                beta1 = -math.asin(y1) + alpha
+            # Return the new point in the collision space.
+            return (x1, y1, mod2pi(beta1))
+    ########################################################END horizontalPath
+
+    def verticalPath(self, x,y,beta):
+        """ This function calculates the next collision for a particle 
+            traveling in a purely vertical direction.
+        """
+        halfLam = self.halfLam
+        delta = self.delta
+        # The x-value will remain unchanged.
+        x1 = x
+        y1 = -y
+        # See if the billiard is in the left cap.
+        if x < -halfLam:
+            # See if the billiard is moving up.
+            if abs(beta - math.pi/2) < delta:
+                # This gives the polar angle with respect to the circle's
+                # origin of the new collision point.
+                thetahat = math.acos(x1 + halfLam)
+                # This gives the new direction of the billiard. This formula
+                # was derived using basic geometry and the fact that the
+                # previous path was parallel with the y-axis (which allowed for
+                # simplifications)
+                beta1 = mod2pi(math.pi/2 + 2*thetahat)
+            # See if the billiard is moving down
+            elif abs(beta - 3*math.pi/2) < delta:
+                thetahat = 2*math.pi - math.acos(x1 + halfLam)
+                beta1 = mod2pi(2*thetahat - 5*math.pi/2)
+            return (x1, y1, mod2pi(beta1))
+    
+        # See if the billiard is traveling between flat walls
+        if x <= halfLam:
+            # See if the billiard is traveling towards the upper side. If so it
+            # will just be reflected back to where it came from.
+            if abs(beta - math.pi/2) < delta:
+                beta1 = 3*math.pi/2
+            else:
+                beta1 = math.pi/2
+            return (x1, y1, mod2pi(beta1))
+    
+        # See if the billiard is in the right cap
+        else:
+            if abs(beta - math.pi/2) < delta:
+                thetahat = math.acos(x1 - halfLam)
+                beta1 = mod2pi(math.pi/2 + 2*thetahat)
+            elif abs(beta - 3*math.pi/2) < delta:
+                thetahat = 2*math.pi - math.acos(x1 - halfLam)
+                beta1 = mod2pi(2*thetahat - 5*math.pi/2)
+            return (x1, y1, mod2pi(beta1))
+    
+    ###########################################################END verticalPath
+
+    ###########################################################################
+    # Batch collision map. The methods below mirror the ones above but act on
+    # NumPy arrays holding one collision per sample. Every wall test is 
+    # applied to all of the samples still waiting for their next collision at
+    # once.
+    ###########################################################################
+
+    def collisionLoopArray(self, x, y, beta, iterations, out=None):
+        """ Vectorized counterpart of collisionLoop. x, y and beta are arrays
+            holding one initial condition per sample. The collision map is 
+            called 'iterations' times on every sample. Returns an array of 
+            shape (samples, iterations+1, 3) whose [i, j] entry is the 
+            (x,y,beta) of the j^th collision of the i^th sample. If out is 
+            given the collisions are written into it instead of a new array. 
+            USES NUMPY.
+        """
+        x = np.array(x, dtype=float)
+        y = np.array(y, dtype=float)
+        beta = np.array(beta, dtype=float)
+    
+        if out is None:
+            out = np.empty((x.size, iterations + 1, 3))
+        points = out
+        points[:, 0, 0] = x
+        points[:, 0, 1] = y
+        points[:, 0, 2] = beta
+    
+        # Iteratively call the batch collision map. Save the collisions
+        # returned.
+        for j in range(1, iterations + 1):
+            (x, y, beta) = self.collisionMapArray(x, y, beta)
+            points[:, j, 0] = x
+            points[:, j, 1] = y
+            points[:, j, 2] = beta
+    
+        return points
+
+    def collisionMapArray(self, x, y, beta):
+        """ Calculates the next collision of every sample given the arrays x,
+            y and beta of previous collisions. The next collisions are returned
+            as the arrays x1, y1, b1. Produces the same values as collisionMap.
+        """
+        halfLam = self.halfLam
+        delta = self.delta
+        beta = mod2piArray(beta)
+    
+        x1 = np.zeros(x.shape)
+        y1 = np.zeros(x.shape)
+        beta1 = np.zeros(x.shape)
+    
+        # Handle the horizontal and vertical special cases first.
+        horizontal = (beta == 0) | (beta == math.pi)
+        vertical = ~horizontal & ((abs(beta - math.pi/2) < delta) | \
+                                  (abs(beta - 3*math.pi/2) < delta))
+    
+        idx = np.flatnonzero(horizontal)
+        if idx.size:
+            (x1[idx], y1[idx], beta1[idx]) = \
+                self.horizontalPathArray(x[idx], y[idx], beta[idx])
+        idx = np.flatnonzero(vertical)
+        if idx.size:
+            (x1[idx], y1[idx], beta1[idx]) = \
+                self.verticalPathArray(x[idx], y[idx], beta[idx])
+    
+        # The samples whose next collision has not been found yet.
+        pending = ~(horizontal | vertical)
+    
+        # Find the wall of the previous collision. The values have the same
+        # meaning as the COLLISION variable of collisionMap.
+        collision = np.zeros(x.shape, dtype=int)
+        side = (-halfLam <= x) & (x <= halfLam)
+        collision[x < -halfLam] = 1
+        collision[side & (y > 0)] = 2
+        collision[x > halfLam] = 3
+        collision[side & (y < 0)] = 4
+    
+        # Compute the slope and the velocity vector of every sample once.
+        m = np.tan(beta)
+        vx = np.cos(beta)
+        vy = np.sin(beta)
+    
+        # Run the wall tests in the same order as collisionMap. Each test only
+        # sees the samples that are still pending and can reach the wall.
+        # Run collision test for upper side.
+        idx = np.flatnonzero(pending & (vy > 0) & (collision != 2))
+        result = self.upperSideCollisionTestArray(x[idx], y[idx], m[idx], \
+                                                  vx[idx], vy[idx])
+        storeCollisions(idx, result, x1, y1, beta1, pending)
+    
+        # Run collision test for lower side.
+        idx = np.flatnonzero(pending & (vy < 0) & (collision != 4))
+        result = self.lowerSideCollisionTestArray(x[idx], y[idx], m[idx], \
+                                                  vx[idx], vy[idx])
+        storeCollisions(idx, result, x1, y1, beta1, pending)
+    
+        idx = np.flatnonzero(pending & ((vx < 0) | (collision == 1)))
+        result = self.leftCapCollisionTestArray(x[idx], y[idx], m[idx], \
+                                                vx[idx], vy[idx], \
+                                                collision[idx])
+        storeCollisions(idx, result, x1, y1, beta1, pending)
+    
+        idx = np.flatnonzero(pending & ((vx > 0) | (collision == 3)))
+        result = self.rightCapCollisionTestArray(x[idx], y[idx], m[idx], \
+                                                 vx[idx], vy[idx], \
+                                                 collision[idx])
+        storeCollisions(idx, result, x1, y1, beta1, pending)
+    
+        for i in np.flatnonzero(pending):
+            print "The collision map did not detect a collision for the " + \
+                  "input: "
+            print "[x,y,beta] = " + str([x[i],y[i],beta[i]])
+    
+        return (x1, y1, beta1)
+    ###########################################END Batch Collision Map#########
+
+    def upperSideCollisionTestArray(self, x, y, m, vx, vy):
+        """ Batch version of upperSideCollisionTest. Returns a boolean array
+            flagging the samples that collide with the upper side together 
+            with the new x, y and beta-values of those samples.
+        """
+        halfLam = self.halfLam
+        # See where the billiard's path intersects the line y=1.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intersection = (1-y)/m + x
+        hit = (-halfLam <= intersection) & (intersection <= halfLam)
+        # use the post collisional velocity vector to find the new direction.
+        beta1 = np.arctan2(-vy[hit], vx[hit])
+        return (hit, intersection[hit], np.ones(beta1.shape), \
+                mod2piArray(beta1))
+
+    def lowerSideCollisionTestArray(self, x, y, m, vx, vy):
+        """ Batch version of lowerSideCollisionTest. Returns a boolean array
+            flagging the samples that collide with the lower side together 
+            with the new x, y and beta-values of those samples.
+        """
+        halfLam = self.halfLam
+        # See where the billiard's path intersects the line y=-1.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intersection = (-1-y)/m + x
+        hit = (-halfLam <= intersection) & (intersection <= halfLam)
+        # use the post collisional velocity vector to find the new direction.
+        beta1 = np.arctan2(-vy[hit], vx[hit])
+        return (hit, intersection[hit], -np.ones(beta1.shape), \
+                mod2piArray(beta1))
+
+    def leftCapCollisionTestArray(self, x, y, m, vx, vy, collision):
+        """ Batch version of leftCapCollisionTest. collision holds the wall of
+            the previous collision of every sample. Returns a boolean array
+            flagging the samples that collide with the left cap together with
+            the new x, y and beta-values of those samples.
+        """
+        halfLam = self.halfLam
+        epsilon = self.epsilon
+        # Set variables used to test for a collision
+        # Square by multiplying, exactly as the scalar versions do.
+        mSquare = m*m
+        a = mSquare + 1
+        b = 2*m*y - 2*mSquare*x + 2*halfLam
+        c = mSquare*(x*x) - 2*m*y*x + y*y + halfLam*halfLam - 1
+        discr = b*b - 4*a*c
+        # Samples with a negative discriminant can not collide with the cap.
+        real = discr >= 0
+        square = np.sqrt(np.where(real, discr, 0))
+        a2 = 2*a
+        # Find the two potential x-values of a collision with the left cap.
+        d = (-b + square)/a2
+        e = (-b - square)/a2
+        # If the previous collision was in the left cap one potential x-value
+        # is the x-value of the previous collision, the other one is the new
+        # one.
+        prev = collision == 1
+        takeD = prev & (abs(x-e) < epsilon) & (d < -halfLam)
+        takeE = prev & ~takeD & (abs(x-d) < epsilon) & (e < -halfLam)
+        # Otherwise test the potential x-values to see if they lie on the cap.
+        takeD = takeD | (~prev & (-halfLam - 1 <= d) & (d < -halfLam))
+        takeE = takeE | (~prev & ~takeD & (-halfLam - 1 <= e) & \
+                         (e < -halfLam))
+        hit = real & (takeD | takeE)
+    
+        x1 = np.where(takeD, d, e)[hit]
+        (x, y, m) = (x[hit], y[hit], m[hit])
         # Set the new y-value
         y1 = m*(x1 - x) + y
-        # Calculate the components of the pre-collisional velocity vector
-        vmx = math.cos(beta)
-        vmy = math.sin(beta)
+        # The components of the pre-collisional velocity vector
+        vmx = vx[hit]
+        vmy = vy[hit]
         # Calculate the components of the inward normal vector
         nx = -(x1 + halfLam)
         ny = -y1
-        # calculate the dot product of the pre-collisional velocity vector and 
-        # the inward normal
+        # Reflect the velocity vector about the inward normal.
         dot = vmx*nx + vmy*ny
-        # Calculate the components of the post-collisional velocity vector
         vpx = vmx - 2*dot*nx
         vpy = vmy - 2*dot*ny
-        # Calculate the direction angle of the post-collisional velocity vector
-        beta1 = math.atan2(vpy, vpx)
-        return (x1, y1, mod2pi(beta1))
-    return None
-
-#####################################End Left Cap Collision Tester
+        beta1 = np.arctan2(vpy, vpx)
+        return (hit, x1, y1, mod2piArray(beta1))
 
-def rightCapCollisionTest(x,y,beta, collision):
-    """ Tests for a collision with the upper right cap. If one is detected,
-        then the new x,y, and beta-values are computed and returned. If not,
-        then None is returned. 
-    """
-    # Set the slope of the line representing the path of the billiard.
-    m = math.tan(beta)
-    # Set variables used to test for a collision
-    mSquare = math.pow(m,2)
-    a = mSquare + 1
-    b = 2*m*y - 2*mSquare*x - 2*halfLam
-    c = mSquare*math.pow(x,2) - 2*m*y*x + math.pow(y,2) \
-        + math.pow(halfLam,2) - 1
-    bSquare = math.pow(b,2)
-    discr = bSquare - 4*a*c
-    # Ensure that the discriminant is non-negative!
-    if discr < 0:
-        return None
-    square = math.sqrt(discr)
-    a2 = 2*a
-    # Find the two potential x-values of a collision with the upper right cap.
-    d = (-b + square)/a2
-    e = (-b - square)/a2
-    # Check if the previous collision was with the upper right cap.
-    if collision == 3:
-        # The previous collision was in the upper right cap. See which 
-        # potential x-value was the x-value of the previous collision.
-        # The other potential x-value must belong to the new collision.
-        # Set collision to 3 to indicate that a collision with upper right cap
-        # was detected so that the new y-value and direction can be computed
-        # below.
-        if abs(x-d) < epsilon and e > halfLam:
-            x1 = e
-            collision = 3
-        elif abs(x-e) < epsilon and d > halfLam:
-            x1 = d
-            collision = 3
-        else:
-            # The previous collision was in the upper right cap and the
-            # old x-value does not correspond to one of the solutions of the
-            # billiard's path intersecting the cap.
-            collision = 0
-    else:
-        # The previous collision was not in the right cap. Test the potential
-        # x-values to see if they lie on the right cap.
-        if halfLam <= d and d <= halfLam + 1 + epsilon:
-            # A collision was detected, set the new x-value, collision to 3
-            # so the new y-value and direction can be computed below.
-            x1 = d
-            collision = 3
-        elif halfLam <= e and e <= halfLam + 1 + epsilon:
-            # A collision was detected, set the new x-value, collision to 3 
-            # so the new y-value and direction can be computed below.
-            x1 = e
-            collision = 3
-    # If a collision was detected we must compute the new y-value and direction
-    # Otherwise we return None as specified.
-    if collision == 3:
-# Set the new y-value
+    def rightCapCollisionTestArray(self, x, y, m, vx, vy, collision):
+        """ Batch version of rightCapCollisionTest. collision holds the wall of
+            the previous collision of every sample. Returns a boolean array
+            flagging the samples that collide with the right cap together with
+            the new x, y and beta-values of those samples.
+        """
+        halfLam = self.halfLam
+        epsilon = self.epsilon
+        # Set variables used to test for a collision
+        # Square by multiplying, exactly as the scalar versions do.
+        mSquare = m*m
+        a = mSquare + 1
+        b = 2*m*y - 2*mSquare*x - 2*halfLam
+        c = mSquare*(x*x) - 2*m*y*x + y*y + halfLam*halfLam - 1
+        discr = b*b - 4*a*c
+        # Samples with a negative discriminant can not collide with the cap.
+        real = discr >= 0
+        square = np.sqrt(np.where(real, discr, 0))
+        a2 = 2*a
+        # Find the two potential x-values of a collision with the right cap.
+        d = (-b + square)/a2
+        e = (-b - square)/a2
+        # If the previous collision was in the right cap one potential x-value
+        # is the x-value of the previous collision, the other one is the new
+        # one.
+        prev = collision == 3
+        takeE = prev & (abs(x-d) < epsilon) & (e > halfLam)
+        takeD = prev & ~takeE & (abs(x-e) < epsilon) & (d > halfLam)
+        # Otherwise test the potential x-values to see if they lie on the cap.
+        takeD = takeD | (~prev & (halfLam <= d) & \
+                         (d <= halfLam + 1 + epsilon))
+        takeE = takeE | (~prev & ~takeD & (halfLam <= e) & \
+                         (e <= halfLam + 1 + epsilon))
+        hit = real & (takeD | takeE)
+    
+        x1 = np.where(takeD, d, e)[hit]
+        (x, y, m) = (x[hit], y[hit], m[hit])
+        # Set the new y-value
         y1 = m*(x1 - x) + y
-        # Calculate the components of the pre-collisional velocity vector
-        vmx = math.cos(beta)
-        vmy = math.sin(beta)
+        # The components of the pre-collisional velocity vector
+        vmx = vx[hit]
+        vmy = vy[hit]
         # Calculate the components of the inward normal vector
         nx = -(x1 - halfLam)
         ny = -y1
-        # calculate the dot product of the pre-collisional velocity vector and 
-        # the inward normal
+        # Reflect the velocity vector about the inward normal.
         dot = vmx*nx + vmy*ny
-        # Calculate the components of the post-collisional velocity vector
         vpx = vmx - 2*dot*nx
         vpy = vmy - 2*dot*ny
-        # Calculate the direction angle of the post-collisional velocity vector
-        beta1 = math.atan2(vpy, vpx)
-        return (x1, y1, mod2pi(beta1))
-    return None
+        beta1 = np.arctan2(vpy, vpx)
+        return (hit, x1, y1, mod2piArray(beta1))
 
-#####################################End Right Cap Collision Tester
-    
+    def horizontalPathArray(self, x, y, beta):
+        """ Batch version of horizontalPath. Every sample must be traveling
+            horizontally, i.e. beta is 0 or pi.
+        """
+        halfLam = self.halfLam
+        # The next collision has the same y-value and the x-value is reflected
+        # about the y-axis.
+        x1 = -x
+        y1 = y.copy()
+        beta1 = np.zeros(x.shape)
+        right = beta == 0
+        # Billiards traveling along the x-axis bounce back along the same path.
+        beta1[(y == 0) & right] = math.pi
+        # The remaining billiards collide with a cap. See horizontalPath for
+        # the derivation of the new direction.
+        idx = np.flatnonzero((y != 0) & right)
+        alpha = np.arccos(x1[idx] - halfLam)
+        beta1[idx] = math.pi + np.arcsin(y1[idx]) + np.sign(y[idx])*alpha
+        idx = np.flatnonzero((y > 0) & ~right)
+        alpha = np.arccos(-(x1[idx] + halfLam))
+        beta1[idx] = 2*math.pi - np.arcsin(y1[idx]) - alpha
+        idx = np.flatnonzero((y < 0) & ~right)
+        alpha = np.arccos(-(x1[idx] + halfLam))
+        beta1[idx] = -np.arcsin(y1[idx]) + alpha
+        return (x1, y1, mod2piArray(beta1))
+
+    def verticalPathArray(self, x, y, beta):
+        """ Batch version of verticalPath. Every sample must be traveling
+            vertically, i.e. beta is within delta of pi/2 or 3pi/2.
+        """
+        halfLam = self.halfLam
+        delta = self.delta
+        # The x-value will remain unchanged.
+        x1 = x.copy()
+        y1 = -y
+        up = abs(beta - math.pi/2) < delta
+        # Billiards between the flat walls are reflected back to where they
+        # came from.
+        beta1 = np.where(up, 3*math.pi/2, math.pi/2)
+        # Billiards in a cap. thetahat is the polar angle, with respect to the
+        # cap's origin, of the new collision point. See verticalPath.
+        for (cap, center) in ((x < -halfLam, -halfLam), \
+                              (x > halfLam, halfLam)):
+            idx = np.flatnonzero(cap & up)
+            thetahat = np.arccos(x1[idx] - center)
+            beta1[idx] = math.pi/2 + 2*thetahat
+            idx = np.flatnonzero(cap & ~up)
+            thetahat = 2*math.pi - np.arccos(x1[idx] - center)
+            beta1[idx] = 2*thetahat - 5*math.pi/2
+        return (x1, y1, mod2piArray(beta1))
+##########################################################END class Stadium###
 
-def horizontalPath(x,y,beta):
-    """ This function calculates the next collision for a particle traveling
-        in a purely horizontal direction. (the set where this happens should
-        have a measure of zero)
+
+def storeCollisions(idx, result, x1, y1, beta1, pending):
+    """ Copies the collisions detected by one of the batch wall tests into
+        the output arrays x1, y1, beta1. idx holds the positions of the
+        samples that were tested and result is the tuple returned by the test.
+        The samples with a detected collision are no longer pending.
     """
-    # The billiard is traveling horizontally so the next collision has the 
-    # same y-value and the x-value is reflected about the y-axis.
-    y1 = y
-    x1 = -x
-    
-    # Check for the special case where the billiard is traveling along the
-    # x-axis. If it is it shall bounce back along the same path.
-    if y == 0:
-        if beta == 0:
-            beta1 = math.pi
-        elif beta == math.pi:
-            beta1 = 0
-        return (x1, y1, mod2pi(beta1))
-    
-    # Check if the billiard is traveling from left to right.
-    # Notice that the billiard can not collide with a flat wall because
-    # it is traveling horizontally, which is parallel to the flat walls.
-    if beta == 0:
-        # This is the angle between the billiard's path and the inward normal.
-        # Since beta is zero, the direction between the path's line and the
-        # inward normal is just the inward normal's angle.
-        alpha = math.acos(x1 - halfLam)
-        # Check if the billiard is traveling towards the upper right cap.
-        if y > 0:
-            # To get the new direction of the billiard we use the
-            # direction of the inward normal and rotate it ccw by alpha.
-            beta1 = math.pi + math.asin(y1) + alpha
-        # Check if the billiard is traveling towards the lower right cap.
-        elif y < 0:
-            # To get the new direction of the billiard we use the direction
-            # of the inward normal and rotate it clockwise by alpha.
-            beta1 = math.pi + math.asin(y1) - alpha
-        # Notice that we don't have to consider the case where y=0 because it 
-        # is handled in the first if statement of this function.
-        # Return the new point in the collision space.
-        return (x1, y1, mod2pi(beta1))
-    
-    # Check if the billiard is traveling from right to left.
-    if beta == math.pi:
-        # Find the angle between the billiard's path and the inward normal.
-        alpha = math.acos(-(x1 + halfLam))
-        # Check if the billiard is traveling towards the upper left cap.
-        if y > 0:
-            # To get the new direction of the billiard take the inward normal's
-            # direction and rotate if clockwise by alpha.
-            beta1 = 2*math.pi - math.asin(y1) - alpha
-        # Check if the billiard is traveling towards the lower left cap.
-        if y < 0:
-            beta1 = -math.asin(y1) + alpha
-        # Return the new point in the collision space.
-        return (x1, y1, mod2pi(beta1))
-############################################################END horizontalPath
-
-    
-def verticalPath(x,y,beta):
-    """ This function calculates the next collision for a particle traveling
-        in a purely vertical direction.
+    (hit, xs, ys, bs) = result
+    idx = idx[hit]
+    x1[idx] = xs
+    y1[idx] = ys
+    beta1[idx] = bs
+    pending[idx] = False
+
+
+###############################################################################
+# Module level wrappers. Each one builds a Stadium for the given lam and calls
+# the method of the same name. lam defaults to 2 for the functions that did
+# not take it before.
+###############################################################################
+
+def collisionLoop(x, y, beta, iterations, lam):
+    """ Calls the collision map 'iterations' times on the initial condition 
+        (x,y,b). Each calculated collision is saved in a list which is returned
+        by this function. See Stadium.collisionLoop.
     """
-    # The x-value will remain unchanged.
-    x1 = x
-    y1 = -y
-    # See if the billiard is in the left cap.
-    if x < -halfLam:
-        # See if the billiard is moving up.
-        if abs(beta - math.pi/2) < delta:
-            # This gives the polar angle with respect to the circle's origin
-            # of the new collision point.
-            thetahat = math.acos(x1 + halfLam)
-            # This gives the new direction of the billiard. This formula was
-            # derived using basic geometry and the fact that the previous path
-            # was parallel with the y-axis (which allowed for simplifications)
-            beta1 = mod2pi(math.pi + 2*thetahat)
-        # See if the billiard is moving down
-        if abs(beta == 3*math.pi/2) < delta:
-            thetahat = 2*math.pi - math.acos(x1 + halfLam)
-            beta1 = mod2pi(2*thetahat - 5*math.pi/2)
-        return (x1, y1, mod2pi(beta1))
-    
-    # See if the billiard is traveling between flat walls
-    if x <= halfLam:
-        # See if the billiard is traveling towards the upper side. If so it
-        # will just be reflected back to where it came from.
-        if abs(beta - math.pi/2) < delta:
-            beta1 = 3*math.pi/2
-        else:
-            beta1 = math.pi/2
-        return (x1, y1, mod2pi(beta1))
-    
-    # See if the billiard is in the right cap
-    else:
-        if abs(beta - math.pi/2) < delta:
-            thetahat = math.acos(x1 - halfLam)
-            beta1 = mod2pi(math.pi/2 + 2*thetahat)
-        elif abs(beta == 3*math.pi/2) < delta:
-            thetahat = 2*math.pi - math.acos(x1 - halfLam)
-            beta1 = mod2pi(2*thetahat - 5*math.pi/2)
-        return (x1, y1, mod2pi(beta1))
-    
-###############################################################END verticalPath  
\ No newline at end of file
+    return Stadium(lam).collisionLoop(x, y, beta, iterations)
+
+def collisionMap(x, y, beta, lam=2):
+    """ Calculates the next collision given the previous collision specified
+        by x,y,beta. See Stadium.collisionMap.
+    """
+    return Stadium(lam).collisionMap(x, y, beta)
+
+def upperSideCollisionTest(x, y, m, vx, vy, lam=2):
+    """ See Stadium.upperSideCollisionTest.
+    """
+    return Stadium(lam).upperSideCollisionTest(x, y, m, vx, vy)
+
+def lowerSideCollisionTest(x, y, m, vx, vy, lam=2):
+    """ See Stadium.lowerSideCollisionTest.
+    """
+    return Stadium(lam).lowerSideCollisionTest(x, y, m, vx, vy)
+
+def leftCapCollisionTest(x, y, m, vx, vy, collision, lam=2):
+    """ See Stadium.leftCapCollisionTest.
+    """
+    return Stadium(lam).leftCapCollisionTest(x, y, m, vx, vy, collision)
+
+def rightCapCollisionTest(x, y, m, vx, vy, collision, lam=2):
+    """ See Stadium.rightCapCollisionTest.
+    """
+    return Stadium(lam).rightCapCollisionTest(x, y, m, vx, vy, collision)
+
+def horizontalPath(x, y, beta, lam=2):
+    """ See Stadium.horizontalPath.
+    """
+    return Stadium(lam).horizontalPath(x, y, beta)
+
+def verticalPath(x, y, beta, lam=2):
+    """ See Stadium.verticalPath.
+    """
+    return Stadium(lam).verticalPath(x, y, beta)
+
+def collisionLoopArray(x, y, beta, iterations, lam, out=None):
+    """ Vectorized counterpart of collisionLoop. See 
+        Stadium.collisionLoopArray.
+    """
+    return Stadium(lam).collisionLoopArray(x, y, beta, iterations, out)
+
+def collisionMapArray(x, y, beta, lam=2):
+    """ Vectorized counterpart of collisionMap. See Stadium.collisionMapArray.
+    """
+    return Stadium(lam).collisionMapArray(x, y, beta)
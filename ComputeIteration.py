@@ -4,101 +4,440 @@ Created on Sun Oct 28 14:08:19 2018
 
 Functions for taking a range of theta-phi values and producing images of these
 sets for display. We use image in the sense of the image of a set
-under a function. Uses PointSampling.py, CoordinateConversion.py, and 
-CollisionMap.py.
+under a function. Any set of theta-phi seeds can be used, the constant theta
+and constant phi ranges are special cases. Uses PointSampling.py,
+CoordinateConversion.py, CollisionMap.py, and TrajectoryStore.py.
 
 @author: Randy
 """
 from PointSampling import evenSpacingSample
 from PointSampling import randomSample
-from CoordinateConversion import thetaphiTOxybeta
-from CoordinateConversion import xybetaTOthetaphi
-from CollisionMap import collisionLoop
+from PointSampling import haltonSample
+from PointSampling import stratifiedSample
+from PointSampling import randomState, radicalInverse
+from CoordinateConversion import thetaphiTOxybetaArray
+from CoordinateConversion import xybetaTOthetaphiArray
+from CollisionMap import collisionLoopArray, Stadium
+from TrajectoryStore import TrajectoryStore, MappedTrajectoryStore
+from multiprocessing import Pool
+import math
+import numpy as np
+
+# The sampling techniques understood by image_const_theta and
+# image_const_phi. All but 'adaptive' are also understood by sampleValues.
+SAMPLETYPES = ("even", "random", "halton", "stratified", "adaptive")
+# The sampling techniques whose samples depend on the seed.
+SEEDEDTYPES = ("random", "stratified")
+# The number of seeds iterated at once when the trajectories are written to
+# a MappedTrajectoryStore.
+MAPPEDCHUNK = 100000
+# Adaptive sampling puts a new seed between two neighbouring seeds whose
+# images are farther apart than this distance in collision space.
+THRESHOLD = 0.1
 
 def image_const_theta(philow, phihigh, samples, theta, iterations, lam, \
-                      sampleType):
+                      sampleType, seed=None, workers=1):
     """ low        := the lower bound of the desired range of phi values.
         high       := the upper bound of the desired range of phi values.
         num        := the number of desired phi values.
         theta      := the the theta value for each point.
         iterations := the number of iterations desired.
         lam        := the parameter that characterizes a Bunimovich Stadium.
-        sampleType := specifies the sampling technique to be used.
-                      'even' for evenly spaced, 'random' for uniform random.
+        sampleType := specifies the sampling technique to be used, see
+                      sampleValues. 'adaptive' for adaptive_const_theta
+                      with its default settings.
+        seed       := seed for the 'random' and 'stratified' sampling
+                      techniques. None gives different samples on every
+                      call.
+        workers    := the number of processes computing the trajectories.
         Uses evenly spaced samples for now... Theta is constant, only
         phi varies. The range for phi is [low, high].
+        Returns a TrajectoryStore holding the trajectory of every sample.
     """
-    if sampleType == 'even':
-        # Get evenly spaced phi values
-        phiArray = evenSpacingSample(philow, phihigh, samples)
-    elif sampleType == 'random':
-        phiArray = randomSample(philow, phihigh, samples)
-    images = []
-    # store the Cartesian coordinates of the trajectories
-    cartesianImages = []
-    # build an list of lists. The inner list is the collision points on 
-    # iteration i. the outer list is a list of iterations.
-    for k in range(iterations):
-        images.append([])
-    for i in range(samples):
-        phi = phiArray[i]
-        # Get the Cartesian values associated with the theta-phi pair
-        (x, y, beta) = thetaphiTOxybeta(theta, phi, lam)
-        # Iterate collisions using (x, y, beta) as seeds.
-        # This returns the trajectory of (x,y,beta)
-        points = collisionLoop(x, y, beta, iterations, lam)
-        # Store this trajectory in cartesianImages
-        cartesianImages.append(points)
-        # Convert each point in the trajectory into a theta-phi pair.
-        for j in range(iterations):
-            (xi, yi, betai) = points[j]
-            # Convert the point and store its associated theta-phi pair as
-            # the j^th collision in the trajectory of the i^th sampled point.
-            # each point is stored as a theta phi pair.
-#            print "(i,j) = (" + str(i) + "," + str(j) + ")"
-            images[j].append(xybetaTOthetaphi(xi, yi, betai, lam))
-    
-    return images,cartesianImages   
+    if sampleType == 'adaptive':
+        return adaptive_const_theta(philow, phihigh, samples, theta, \
+                                    iterations, lam, workers=workers)
+    phiArray = sampleValues(philow, phihigh, samples, sampleType, seed)
+    return image_seeds(theta, phiArray[:samples], iterations, lam, workers)
+
 
 def image_const_phi(thetalow, thetahigh, samples, phi, iterations, lam, \
-                    sampleType):
+                    sampleType, seed=None, workers=1):
     """ low        := the lower bound of the desired range of theta values.
         high       := the upper bound of the desired range of theta values.
         sample     := the number of desired theta values.
         phi        := the the phi value for each point.
         iterations := the number of iterations desired.
         lam        := the parameter that characterizes a Bunimovich Stadium.
-        sampleType := specifies the sampling technique to be used.
-                      'e' for evenly spaced, 'u' for uniform random.
+        sampleType := specifies the sampling technique to be used, see
+                      sampleValues. 'adaptive' for adaptive_const_phi
+                      with its default settings.
+        seed       := seed for the 'random' and 'stratified' sampling
+                      techniques. None gives different samples on every
+                      call.
+        workers    := the number of processes computing the trajectories.
         The range for phi is [low, high].
+        Returns a TrajectoryStore holding the trajectory of every sample.
+    """
+    if sampleType == 'adaptive':
+        return adaptive_const_phi(thetalow, thetahigh, samples, phi, \
+                                  iterations, lam, workers=workers)
+    thetaarray = sampleValues(thetalow, thetahigh, samples, sampleType, seed)
+    return image_seeds(thetaarray[:samples], phi, iterations, lam, workers)
+
+
+def image_seeds(theta, phi, iterations, lam, workers=1):
+    """ theta, phi := arrays (or numbers) of seeds in collision space, e.g.
+                      from PointSampling.lineSeeds, gridSeeds or diskSeeds.
+                      They are broadcast against each other and flattened.
+        iterations := the number of iterations desired.
+        lam        := the parameter that characterizes a Bunimovich Stadium.
+        workers    := the number of processes computing the trajectories.
+        Returns a TrajectoryStore holding the trajectory of every seed, in
+        the order of the flattened seeds.
+    """
+    (x, y, beta) = seedsTOxybeta(theta, phi, lam)
+    # Iterate collisions using (x, y, beta) as seeds.
+    return computeTrajectories(x, y, beta, iterations, lam, workers)
+
+
+def adaptive_const_theta(philow, phihigh, samples, theta, iterations, lam, \
+                         initial=None, threshold=THRESHOLD, refine=None, \
+                         workers=1):
+    """ Adaptive version of image_const_theta, the samples are spread over
+        [philow, phihigh] by adaptive_seeds. samples is the total number of
+        samples. See adaptive_seeds for the other arguments.
+    """
+    return adaptive_seeds(theta, philow, theta, phihigh, samples, \
+                          iterations, lam, initial, threshold, refine, \
+                          workers)
+
+def adaptive_const_phi(thetalow, thetahigh, samples, phi, iterations, lam, \
+                       initial=None, threshold=THRESHOLD, refine=None, \
+                       workers=1):
+    """ Adaptive version of image_const_phi, the samples are spread over
+        [thetalow, thetahigh] by adaptive_seeds. samples is the total number
+        of samples. See adaptive_seeds for the other arguments.
+    """
+    return adaptive_seeds(thetalow, phi, thetahigh, phi, samples, \
+                          iterations, lam, initial, threshold, refine, \
+                          workers)
+
+def adaptive_seeds(thetastart, phistart, thetaend, phiend, samples, \
+                   iterations, lam, initial=None, threshold=THRESHOLD, \
+                   refine=None, workers=1):
+    """ thetastart, phistart := the first end of a segment of collision
+                                space.
+        thetaend, phiend     := the other end of the segment.
+        samples              := the total number of seeds, the budget.
+        iterations           := the number of iterations desired.
+        lam                  := the parameter that characterizes a
+                                Bunimovich Stadium.
+        initial              := the number of evenly spaced seeds to start
+                                with, both ends included. A quarter of the
+                                budget by default.
+        threshold            := the largest distance allowed between the
+                                images of neighbouring seeds.
+        refine               := the iteration whose images are compared,
+                                the last one by default.
+        workers              := the number of processes computing the
+                                trajectories.
+        Starts with evenly spaced seeds on the segment. Then, as long as the
+        budget allows, puts a new seed halfway between every two
+        neighbouring seeds whose images at iteration 'refine' are farther
+        apart than threshold. Only the new seeds are iterated. When the
+        budget does not cover all of them, the farthest apart images are
+        split first. Images that could not be converted to theta-phi pairs
+        are never split.
+        Returns a TrajectoryStore holding the trajectory of every seed, in
+        order along the segment. At most 'samples' seeds are used, fewer if
+        no images are left farther apart than threshold.
+    """
+    if initial is None:
+        initial = max(samples//4, 2)
+    initial = min(initial, samples)
+    if refine is None:
+        refine = iterations
+    dtheta = thetaend - thetastart
+    dphi = phiend - phistart
+    # The position of every seed along the segment, from 0 to 1.
+    t = np.linspace(0, 1, initial)
+    store = image_seeds(thetastart + dtheta*t, phistart + dphi*t, \
+                        iterations, lam, workers)
+    while store.samples < samples:
+        gaps = imageGaps(store.thetaphi[:, refine])
+        wide = np.nonzero(gaps > threshold)[0]
+        # Seeds too close together to be split any further are left alone.
+        middle = (t[wide] + t[wide + 1])/2
+        wide = wide[(middle > t[wide]) & (middle < t[wide + 1])]
+        if wide.size == 0:
+            break
+        room = samples - store.samples
+        if wide.size > room:
+            widest = np.argsort(-gaps[wide], kind="mergesort")[:room]
+            wide = np.sort(wide[widest])
+        middle = (t[wide] + t[wide + 1])/2
+        new = image_seeds(thetastart + dtheta*middle, \
+                          phistart + dphi*middle, iterations, lam, workers)
+        store.insert(wide + 1, new)
+        t = np.insert(t, wide + 1, middle)
+    return store
+
+def imageGaps(thetaphi):
+    """ thetaphi := array of shape (samples, 2) of theta-phi pairs.
+        Returns the array of the distances in collision space between every
+        pair and the next one. theta is periodic, so the short way around
+        is taken. The distance is nan where a pair is nan.
+    """
+    dtheta = np.mod(np.diff(thetaphi[:, 0]) + math.pi, 2*math.pi) - math.pi
+    return np.hypot(dtheta, np.diff(thetaphi[:, 1]))
+
+
+def stream_const_theta(philow, phihigh, samples, theta, iterations, lam, \
+                       sampleType, seed=None):
+    """ Streaming version of image_const_theta. Takes the same arguments and
+        yields the tuple (k, cartesian, thetaphi) for k = 0, ..., iterations
+        where cartesian is a (samples, 3) array of the k^th collisions in
+        (x,y,beta) and thetaphi is a (samples, 2) array of the same collisions
+        as theta-phi pairs. Only one iteration is held in memory at a time.
+    """
+    phiArray = sampleValues(philow, phihigh, samples, sampleType, seed)
+    return stream_seeds(theta, phiArray[:samples], iterations, lam)
+
+def stream_const_phi(thetalow, thetahigh, samples, phi, iterations, lam, \
+                     sampleType, seed=None):
+    """ Streaming version of image_const_phi. Takes the same arguments and
+        yields the tuple (k, cartesian, thetaphi) for k = 0, ..., iterations.
+        See stream_const_theta.
+    """
+    thetaarray = sampleValues(thetalow, thetahigh, samples, sampleType, seed)
+    return stream_seeds(thetaarray[:samples], phi, iterations, lam)
+
+def stream_seeds(theta, phi, iterations, lam):
+    """ Streaming version of image_seeds. Takes the same arguments, except
+        workers, and yields the tuple (k, cartesian, thetaphi) for
+        k = 0, ..., iterations. See stream_const_theta.
+    """
+    (x, y, beta) = seedsTOxybeta(theta, phi, lam)
+    return streamTrajectories(x, y, beta, iterations, lam)
+
+def seedsTOxybeta(theta, phi, lam):
+    """ Returns the seeds theta, phi as flat arrays x, y, beta of Cartesian
+        coordinates. theta and phi are broadcast against each other.
     """
+    (theta, phi) = np.broadcast_arrays(np.asarray(theta, dtype=float), \
+                                       np.asarray(phi, dtype=float))
+    return thetaphiTOxybetaArray(theta.ravel(), phi.ravel(), lam)
+
+def streamTrajectories(x, y, beta, iterations, lam):
+    """ x, y, beta := arrays holding the seeds in Cartesian coordinates.
+        iterations := the number of iterations desired.
+        lam        := the parameter that characterizes a Bunimovich Stadium.
+        Generator yielding the tuple (k, cartesian, thetaphi) for every
+        iteration k = 0, ..., iterations. Iteration k+1 is only computed once
+        the consumer asks for it.
+    """
+    stadium = Stadium(lam)
+    for k in range(iterations + 1):
+        if k > 0:
+            (x, y, beta) = stadium.collisionMapArray(x, y, beta)
+        cartesian = np.column_stack((x, y, beta))
+        thetaphi = np.column_stack(xybetaTOthetaphiArray(x, y, beta, lam))
+        yield (k, cartesian, thetaphi)
+
+def sampleValues(low, high, samples, sampleType, seed=None):
+    """ Returns 'samples' values of the sampled variable in [low, high] using
+        the sampling technique sampleType, one of SAMPLETYPES other than
+        'adaptive'. 'even' for evenly spaced, 'random' for uniform random,
+        'halton' for the low-discrepancy Halton sequence and 'stratified'
+        for one uniform random value in each of 'samples' equal parts of
+        the range. seed is only used by the techniques of SEEDEDTYPES.
+    """
+    if sampleType == 'adaptive':
+        raise ValueError("Adaptive samples depend on their images, use " \
+                         "image_const_theta or image_const_phi")
     if sampleType == 'even':
-        # Get evenly spaced theta values
-        thetaarray = evenSpacingSample(thetalow, thetahigh, samples)
+        # Get evenly spaced values
+        return evenSpacingSample(low, high, samples)
     elif sampleType == 'random':
-        thetaarray = randomSample(thetalow, thetahigh, samples)
-    images = []
-    # This will store the Cartesian coordinates of the trajectories
-    cartesianImages = []
-    # build an list of lists. The inner list is the collision points on 
-    # iteration i. the outer list is a list of iterations.
-    for k in range(iterations):
-        images.append([])
-    for i in range(samples):
-        theta = thetaarray[i]
-        # get the Cartesian values associated with this theta-phi pair
-        (x, y, beta) = thetaphiTOxybeta(theta, phi, lam)
-        # Iterate collisions using (x, y, beta) as seeds.
-        # This returns the trajectory of (x,y,beta)
-        points = collisionLoop(x, y, beta, iterations, lam)
-        # Store this trajectory in cartesianImages
-        cartesianImages.append(points)
-        # Convert each point in the trajectory into a theta-phi pair.
-        for j in range(iterations):
-            (xi, yi, betai) = points[j]
-            # Convert the point and store its associated theta-phi pair as
-            # the j^th collision in the trajectory of the i^th sampled point.
-            # each point is stored as a theta phi pair.
-            images[j].append(xybetaTOthetaphi(xi, yi, betai, lam))
-    
-    return images,cartesianImages
\ No newline at end of file
+        return randomSample(low, high, samples, seed)
+    elif sampleType == 'halton':
+        return haltonSample(low, high, samples)
+    elif sampleType == 'stratified':
+        return stratifiedSample(low, high, samples, seed)
+    raise ValueError("Invalid sample type " + str(sampleType))
+
+def sampleChunks(low, high, samples, sampleType, seed, chunk):
+    """ Generator yielding the values of sampleValues in pieces of at most
+        'chunk' values. Only one piece is made at a time, so the memory used
+        does not grow with 'samples'. Together the pieces hold the same
+        values as sampleValues, but they are not sorted across pieces.
+    """
+    if sampleType not in SAMPLETYPES or sampleType == 'adaptive':
+        # Let sampleValues report the problem.
+        sampleValues(low, high, 0, sampleType, seed)
+    generator = randomState(seed)
+    step = (high-low)/float(samples)
+    for a in range(0, samples, chunk):
+        b = min(a + chunk, samples)
+        if sampleType == 'even':
+            # The values of evenSpacingSample.
+            yield low + np.arange(a, b)*((low + step) - low)
+        elif sampleType == 'random':
+            # Consecutive draws give the values of one draw of randomSample.
+            yield (high - low)*generator.rand(b - a) + low
+        elif sampleType == 'halton':
+            yield low + (high - low)*radicalInverse(b - a, 2, a)
+        elif sampleType == 'stratified':
+            yield low + (np.arange(a, b) + generator.rand(b - a))*step
+
+def computeTrajectories(x, y, beta, iterations, lam, workers=1):
+    """ x, y, beta := arrays holding the seeds in Cartesian coordinates.
+        iterations := the number of iterations desired.
+        lam        := the parameter that characterizes a Bunimovich Stadium.
+        workers    := the number of processes to use.
+        Returns a TrajectoryStore holding the trajectory of every seed. With
+        more than one worker the seeds are split into chunks which are
+        handed out to a pool of processes. The chunks are put back together
+        in sample order, so the result does not depend on 'workers'.
+    """
+    store = TrajectoryStore(x.size, iterations, lam)
+    if workers <= 1:
+        trajectoryChunk((x, y, beta, iterations, lam, store))
+        return store
+    # Use a few chunks per worker so that the work stays balanced.
+    bounds = np.linspace(0, x.size, 4*workers + 1).astype(int)
+    chunks = [(x[a:b], y[a:b], beta[a:b], iterations, lam, None) \
+              for (a, b) in zip(bounds[:-1], bounds[1:])]
+    pool = Pool(workers)
+    try:
+        results = pool.map(trajectoryChunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    for (a, b, chunk) in zip(bounds[:-1], bounds[1:], results):
+        store.cartesian[a:b] = chunk.cartesian
+        store.thetaphi[a:b] = chunk.thetaphi
+    return store
+
+def extendTrajectories(store, iterations, workers=1):
+    """ store      := a TrajectoryStore made by computeTrajectories.
+        iterations := the number of iterations to add.
+        workers    := the number of processes to use.
+        Continues every trajectory of store for 'iterations' more iterations
+        and appends them to store, which is also returned. The collision map
+        only depends on the last collision, so only the new iterations are
+        computed and the result is the same as computing all the iterations
+        at once.
+    """
+    last = store.cartesian[:, -1]
+    tail = computeTrajectories(last[:, 0].copy(), last[:, 1].copy(), \
+                               last[:, 2].copy(), iterations, store.lam, \
+                               workers)
+    store.append(tail)
+    return store
+
+def mapped_seeds(theta, phi, iterations, lam, directory, \
+                 chunk=MAPPEDCHUNK, workers=1):
+    """ On disk version of image_seeds, see mapTrajectories. The seeds are
+        converted to Cartesian coordinates a chunk at a time.
+    """
+    (theta, phi) = np.broadcast_arrays(np.asarray(theta, dtype=float), \
+                                       np.asarray(phi, dtype=float))
+    store = MappedTrajectoryStore.create(directory, theta.size, 0, lam)
+    for a in range(0, theta.size, chunk):
+        # Slices of the flat iterators copy only the seeds of one chunk.
+        store.cartesianFile[0, a:a + chunk] = np.column_stack( \
+            seedsTOxybeta(theta.flat[a:a + chunk], phi.flat[a:a + chunk], \
+                          lam))
+    return extendMappedTrajectories(store, iterations, chunk, workers)
+
+def mapTrajectories(x, y, beta, iterations, lam, directory, \
+                    chunk=MAPPEDCHUNK, workers=1):
+    """ x, y, beta := arrays holding the seeds in Cartesian coordinates.
+        iterations := the number of iterations desired.
+        lam        := the parameter that characterizes a Bunimovich Stadium.
+        directory  := the directory the trajectories are written to. Files
+                      of an earlier store in it are replaced.
+        chunk      := the number of seeds iterated at once.
+        workers    := the number of processes to use.
+        Same as computeTrajectories, but the trajectories are written into
+        a new MappedTrajectoryStore, which is returned. Apart from the
+        seeds themselves, only 'chunk' seeds are held in memory at a time,
+        so the trajectories can be larger than memory.
+    """
+    store = MappedTrajectoryStore.create(directory, x.size, 0, lam)
+    # The theta-phi pairs of the seeds are written by mappedChunk.
+    for (column, values) in enumerate((x, y, beta)):
+        store.cartesianFile[0, :, column] = values
+    return extendMappedTrajectories(store, iterations, chunk, workers)
+
+def extendMappedTrajectories(store, iterations, chunk=MAPPEDCHUNK, \
+                             workers=1):
+    """ store      := a MappedTrajectoryStore opened for writing.
+        iterations := the number of iterations to add.
+        chunk      := the number of seeds iterated at once.
+        workers    := the number of processes to use.
+        On disk version of extendTrajectories. The files of store are grown
+        first, then every chunk of seeds is continued from its last
+        collision and written straight into them, one iteration at a time.
+        Returns store.
+    """
+    first = store.iterations
+    store.resize(first + iterations)
+    bounds = range(0, store.samples, chunk) + [store.samples]
+    chunks = [(store.directory, a, b, first, iterations, store.lam) \
+              for (a, b) in zip(bounds[:-1], bounds[1:])]
+    if workers <= 1:
+        map(mappedChunk, chunks)
+        return store
+    pool = Pool(workers)
+    try:
+        # Every chunk writes its own part of the files.
+        pool.map(mappedChunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    return store
+
+def mappedChunk(args):
+    """ args := the tuple (directory, a, b, first, iterations, lam).
+        Continues the trajectories of the samples a to b-1 of the
+        MappedTrajectoryStore in directory from iteration 'first' for
+        'iterations' iterations, writing each iteration into the store as
+        soon as it is computed. A new store (first is 0) only holds the
+        seeds in Cartesian coordinates, their theta-phi pairs are written
+        here too. This is a module level function so that the process pool
+        can call it.
+    """
+    (directory, a, b, first, iterations, lam) = args
+    store = MappedTrajectoryStore(directory)
+    last = store.cartesianFile[first, a:b]
+    for (k, cartesian, thetaphi) in streamTrajectories( \
+            last[:, 0].copy(), last[:, 1].copy(), last[:, 2].copy(), \
+            iterations, lam):
+        if k > 0:
+            store.cartesianFile[first + k, a:b] = cartesian
+        if k > 0 or first == 0:
+            store.thetaphiFile[first + k, a:b] = thetaphi
+    store.flush()
+
+def trajectoryChunk(args):
+    """ args := the tuple (x, y, beta, iterations, lam, store).
+        Computes the trajectories of one chunk of seeds and writes them into
+        store. A new TrajectoryStore is made if store is None. Returns the
+        store. This is a module level function so that the process pool can
+        call it.
+    """
+    (x, y, beta, iterations, lam, store) = args
+    if store is None:
+        store = TrajectoryStore(x.size, iterations, lam)
+    # The trajectories of all the seeds are written straight into the store.
+    collisionLoopArray(x, y, beta, iterations, lam, out=store.cartesian)
+    # Convert every point of every trajectory into a theta-phi pair in one
+    # pass. The [i, j] entry is the j^th collision of the i^th sampled point.
+    (store.thetaphi[:, :, 0], store.thetaphi[:, :, 1]) = \
+        xybetaTOthetaphiArray(store.cartesian[:, :, 0], \
+                              store.cartesian[:, :, 1], \
+                              store.cartesian[:, :, 2], lam)
+    return store
\ No newline at end of file
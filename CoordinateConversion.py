@@ -9,6 +9,7 @@ space to and from Cartesian and spherical.
 @author: Randy
 """
 import math
+import numpy as np
 
 def thetaphiTOxybeta(theta, phi, lam):
     """ theta := polar angle of the location where a collision occurs.
@@ -49,7 +50,7 @@ def thetaphiTOxybeta(theta, phi, lam):
     
     # Left cap
     if math.pi - ref < theta and math.pi + ref > theta:
-        rho = -halfLam*cos + math.sqrt(1 - math.pow(sin*halfLam,2))
+        rho = -halfLam*cos + math.sqrt(1 - (sin*halfLam)*(sin*halfLam))
         x   = rho*cos
         y   = rho*sin
         vx = -(x + halfLam)*math.cos(phi) + y*math.sin(phi)
@@ -60,7 +61,7 @@ def thetaphiTOxybeta(theta, phi, lam):
     # Right cap
     if (0 <= theta and theta < ref) or \
     (2*math.pi - ref < theta and theta <= 2*math.pi):
-        rho = halfLam*cos + math.sqrt(1 - math.pow(sin*halfLam,2))
+        rho = halfLam*cos + math.sqrt(1 - (sin*halfLam)*(sin*halfLam))
         x   = rho*cos
         y   = rho*sin
         vx = -(x - halfLam)*math.cos(phi) + y*math.sin(phi)
@@ -113,13 +114,122 @@ def xybetaTOthetaphi(x, y, beta, lam):
     phi = psi - math.pi/2
     return (theta, phi)
 #--------------------------------------------------- End xybetaTOthetaphi
+
+
+def thetaphiTOxybetaArray(theta, phi, lam):
+    """ Vectorized counterpart of thetaphiTOxybeta. theta and phi are arrays
+        (or a scalar and an array) of collision space coordinates. Every
+        point's wall is found at once and the arrays x, y and beta are
+        returned. USES NUMPY.
+    """
+    # The reference angle and halfLam are computed once for all points.
+    ref = math.atan(float(2)/lam)
+    halfLam = float(lam)/2
+    (theta, phi) = np.broadcast_arrays(mod2piArray(theta), \
+                                       np.asarray(phi, dtype=float))
+    x = np.empty(theta.shape)
+    y = np.empty(theta.shape)
+    beta = np.empty(theta.shape)
+    
+    # Classify the wall every point resides on. The regions are the same as
+    # in thetaphiTOxybeta.
+    top = (ref <= theta) & (theta <= math.pi - ref)
+    bottom = (math.pi + ref <= theta) & (theta <= 2*math.pi - ref)
+    left = (math.pi - ref < theta) & (theta < math.pi + ref)
+    right = ~(top | bottom | left)
+    
+    # Top side
+    x[top] = float(1)/np.tan(theta[top])
+    y[top] = 1
+    beta[top] = 3*math.pi/2 + phi[top]
+    
+    # Bottom side
+    x[bottom] = -float(1)/np.tan(theta[bottom])
+    y[bottom] = -1
+    beta[bottom] = math.pi/2 + phi[bottom]
+    
+    # Left cap and right cap. Only the center of the cap differs.
+    for (cap, center) in ((left, -halfLam), (right, halfLam)):
+        thetaCap = theta[cap]
+        phiCap = phi[cap]
+        cos = np.cos(thetaCap)
+        sin = np.sin(thetaCap)
+        rho = center*cos + np.sqrt(1 - (sin*halfLam)*(sin*halfLam))
+        xCap = rho*cos
+        yCap = rho*sin
+        vx = -(xCap - center)*np.cos(phiCap) + yCap*np.sin(phiCap)
+        vy = -(xCap - center)*np.sin(phiCap) - yCap*np.cos(phiCap)
+        x[cap] = xCap
+        y[cap] = yCap
+        beta[cap] = mod2piArray(np.arctan2(vy, vx))
+    return (x, y, beta)
+#--------------------------------------------- End of thetaphiTOxybetaArray
+
+
+def xybetaTOthetaphiArray(x, y, beta, lam):
+    """ Vectorized counterpart of xybetaTOthetaphi. x, y and beta are arrays
+        of collisions. Every point's wall is found at once and the arrays
+        theta and phi are returned. USES NUMPY.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    beta = np.asarray(beta, dtype=float)
+    # Calculate theta
+    theta = mod2piArray(np.arctan2(y, x))
+    halfLam = float(lam)/2
+    
+    # psi is the angle between the post collisional velocity vector and the
+    # positively oriented tangent to the stadium's boundary.
+    psi = np.empty(x.shape)
+    right = x > halfLam
+    left = x < -halfLam
+    top = ~right & ~left & (y == 1)
+    bottom = ~right & ~left & (y == -1)
+    bad = ~(right | left | top | bottom)
+    
+    # Right cap
+    psi[right] = np.arccos(-y[right]*np.cos(beta[right]) + \
+                           (x[right] - halfLam)*np.sin(beta[right]))
+    # Left cap
+    psi[left] = np.arccos(-y[left]*np.cos(beta[left]) + \
+                          (x[left] + halfLam)*np.sin(beta[left]))
+    # The Sides
+    psi[top] = beta[top] - math.pi
+    psi[bottom] = beta[bottom]
+    # Points between the caps must lie on one of the flat walls.
+    psi[bad] = np.nan
+    for (xi, yi, betai) in zip(x[bad], y[bad], beta[bad]):
+        print "An attempt was made to convert x,y to theta,phi but"
+        print "the x-value corresponds to a side of the stadia and"
+        print "the y-value does not! The bad values are: "
+        print "[x,y,beta] = " + str([xi,yi,betai])
+    # Use psi to find phi
+    phi = psi - math.pi/2
+    return (theta, phi)
+#--------------------------------------------- End xybetaTOthetaphiArray
     
 
 def mod2pi(angle):
-    """ Takes an angle and returns the co-terminal angle in [0,2pi).
+    """ Takes an angle and returns the co-terminal angle in [0,2pi). The angle
+        may also be a NumPy array of angles, see mod2piArray.
     """
-    while angle < 0:
+    if isinstance(angle, np.ndarray):
+        return mod2piArray(angle)
+    # fmod is exact, so the cost does not grow with the size of the angle.
+    angle = math.fmod(angle, 2*math.pi)
+    if angle < 0:
         angle = angle + 2*math.pi
-    while angle >= 2*math.pi:
+    # A tiny negative remainder can round up to 2pi when shifted.
+    if angle >= 2*math.pi:
         angle = angle - 2*math.pi
     return angle
+
+def mod2piArray(angles):
+    """ Takes an array of angles and returns the array of co-terminal angles
+        in [0,2pi). USES NUMPY.
+    """
+    # Same steps as the scalar path of mod2pi.
+    angles = np.fmod(angles, 2*math.pi)
+    angles = np.where(angles < 0, angles + 2*math.pi, angles)
+    # A tiny negative remainder can round up to 2pi when shifted.
+    return np.where(angles >= 2*math.pi, angles - 2*math.pi, angles)
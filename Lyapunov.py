@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Estimates the largest Lyapunov exponent of the collision map, the rate at
+which nearby orbits separate. Uses the paired orbit method: every initial
+condition is followed together with a shadow orbit a tiny distance away in
+collision space. After each collision the separation is measured and the
+shadow is pulled back to the original distance along the new direction of
+separation. The average of the logarithms of the growth factors converges to
+the exponent. All initial conditions are iterated at once. Uses
+CollisionMap.py and CoordinateConversion.py.
+"""
+import math
+import numpy as np
+from CollisionMap import Stadium
+from CoordinateConversion import thetaphiTOxybetaArray
+from CoordinateConversion import xybetaTOthetaphiArray
+from CoordinateConversion import mod2piArray
+
+# Distance in collision space between an orbit and its shadow.
+SEPARATION = math.pow(10,-8)
+
+class LyapunovEstimate(object):
+    """ running := array of shape (iterations, seeds). The [k, i] entry is
+                   the estimate for the i^th initial condition after k+1
+                   collisions, nan once its orbits could not be followed.
+        valid   := boolean array, True for the initial conditions whose
+                   orbits were followed for every iteration.
+        The exponents are per collision, in units of 1/collision.
+    """
+    def __init__(self, running, valid):
+        self.running = running
+        self.valid = valid
+
+    @property
+    def exponents(self):
+        """ The final estimate for every initial condition.
+        """
+        return self.running[-1]
+
+    @property
+    def mean(self):
+        """ The mean of the final estimates of the valid initial conditions.
+        """
+        return self.exponents[self.valid].mean()
+
+    @property
+    def spread(self):
+        """ The standard deviation of the final estimates of the valid
+            initial conditions.
+        """
+        return self.exponents[self.valid].std()
+
+    @property
+    def stderr(self):
+        """ The standard error of the mean.
+        """
+        return self.spread/math.sqrt(max(self.valid.sum(), 1))
+
+    @property
+    def drift(self):
+        """ The mean absolute change of the estimates over the second half
+            of the iterations. Small values mean that the estimates have
+            converged.
+        """
+        half = self.running[(self.running.shape[0] - 1)//2]
+        return np.abs(self.exponents - half)[self.valid].mean()
+
+    def report(self):
+        """ Prints the convergence statistics.
+        """
+        print "Initial conditions followed: " + str(self.valid.sum()) + \
+              " of " + str(self.valid.size)
+        print "Largest Lyapunov exponent: " + str(self.mean) + " +/- " + \
+              str(self.stderr) + " per collision"
+        print "Spread over initial conditions: " + str(self.spread)
+        print "Drift over the second half of the run: " + str(self.drift)
+
+def lyapunov(theta, phi, iterations, lam, separation=SEPARATION):
+    """ theta, phi := arrays (or numbers) of initial conditions in collision
+                      space. They are broadcast against each other.
+        iterations := the number of collisions to average over.
+        lam        := the parameter that characterizes a Bunimovich Stadium.
+        separation := the distance between an orbit and its shadow.
+        Returns a LyapunovEstimate holding the estimate for every initial
+        condition after every collision.
+    """
+    (theta, phi) = np.broadcast_arrays(np.asarray(theta, dtype=float), \
+                                       np.asarray(phi, dtype=float))
+    theta = theta.ravel()
+    phi = phi.ravel()
+    stadium = Stadium(lam)
+    # The first separation is along the diagonal of collision space.
+    step = separation/math.sqrt(2)
+    (x, y, beta) = thetaphiTOxybetaArray(theta, phi, lam)
+    (st, sp) = shadowPoint(theta, phi, np.full(theta.size, step), \
+                           np.full(theta.size, step))
+    (sx, sy, sbeta) = thetaphiTOxybetaArray(st, sp, lam)
+    logs = np.zeros(theta.size)
+    running = np.full((iterations, theta.size), np.nan)
+    valid = np.ones(theta.size, dtype=bool)
+
+    for k in range(iterations):
+        # Only follow the orbits that have not failed yet.
+        idx = np.nonzero(valid)[0]
+        (x[idx], y[idx], beta[idx]) = \
+            stadium.collisionMapArray(x[idx], y[idx], beta[idx])
+        (sx[idx], sy[idx], sbeta[idx]) = \
+            stadium.collisionMapArray(sx[idx], sy[idx], sbeta[idx])
+        (t, p) = xybetaTOthetaphiArray(x[idx], y[idx], beta[idx], lam)
+        (st, sp) = xybetaTOthetaphiArray(sx[idx], sy[idx], sbeta[idx], lam)
+        # theta is periodic, take the short way around.
+        dtheta = np.mod(st - t + math.pi, 2*math.pi) - math.pi
+        dphi = sp - p
+        dist = np.hypot(dtheta, dphi)
+        # An orbit is lost when a collision could not be converted, or when
+        # the shadow fell onto the orbit.
+        good = np.isfinite(dist)
+        good[good] = dist[good] > 0
+        valid[idx[~good]] = False
+        idx = idx[good]
+        logs[idx] += np.log(dist[good]/separation)
+        running[k, idx] = logs[idx]/(k + 1)
+        # Pull the shadow back to the original distance.
+        scale = separation/dist[good]
+        (st, sp) = shadowPoint(t[good], p[good], dtheta[good]*scale, \
+                               dphi[good]*scale)
+        (sx[idx], sy[idx], sbeta[idx]) = thetaphiTOxybetaArray(st, sp, lam)
+    return LyapunovEstimate(running, valid)
+
+def shadowPoint(theta, phi, dtheta, dphi):
+    """ Returns the pair (theta + dtheta, phi + dphi) with theta in
+        [0, 2pi). Where phi + dphi would leave [-pi/2, pi/2] the separation
+        is reversed instead, which does not change its length.
+    """
+    out = np.abs(phi + dphi) > math.pi/2
+    sign = np.where(out, -1.0, 1.0)
+    return (mod2piArray(theta + sign*dtheta), phi + sign*dphi)
@@ -25,7 +25,7 @@ The second drop down menu, labeled "Sampled Variable Range", allows the user to
 
 The third drop down menu, labeled "Number of samples", allows the user to specify the number of samples to be used in the computations.
 
-The fourth drop down menu, labeled "Sampling Method", allows the user to specify how the samples are selected. "even" yeilds evely spaced samples in the specified interval while "random" selects points randomly.
+The fourth drop down menu, labeled "Sampling Method", allows the user to specify how the samples are selected. "even" yeilds evely spaced samples in the specified interval while "random" selects points randomly. "halton" uses a low-discrepancy sequence, which covers the interval evenly without the regular spacing of "even", and "stratified" splits the interval into equal parts and picks one random point in each. "adaptive" starts with a quarter of the samples evenly spaced and spends the rest between neighbouring samples whose last iterations are far apart, where the evolution stretches the sampled range the most.
 
 The fifth drop down menu, labeled "Number of iterations", allows the user to specify the number of iterations of the collsion map to be computed.
 
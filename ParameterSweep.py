@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the same sampling experiment for many stadia. For every value of lam the
+sampled collision points are iterated, the spread of their image is measured
+after every iteration and the largest Lyapunov exponent is estimated from the
+same points. The values of lam are handed out to a pool of processes and the
+results are collected into one table which can be written as a csv file. Uses
+ComputeIteration.py and Lyapunov.py.
+"""
+import csv
+import math
+from multiprocessing import Pool
+import numpy as np
+from ComputeIteration import image_const_phi
+from ComputeIteration import image_const_theta
+from Lyapunov import lyapunov
+
+# The columns of the table returned by sweep.
+COLUMNS = ("lam", "iteration", "theta_spread", "phi_spread", "lyapunov", \
+           "lyapunov_stderr")
+
+def sweep(lams, const, sampleParamLow, sampleParamHi, samples, param, \
+          iterations, sampleType, seed=None, lyapunovIterations=200, \
+          workers=1):
+    """ lams               := the values of lam, e.g. np.linspace(0.5, 4, 8).
+        lyapunovIterations := the number of collisions the Lyapunov
+                              exponent is averaged over.
+        workers            := the number of processes, each one handles one
+                              value of lam at a time.
+        The other arguments have the same meaning as in Plotter.plotter.
+        Returns the table as a list of rows, one for every value of lam and
+        every iteration from 0 to 'iterations', in that order. The entries
+        of a row are given by COLUMNS:
+            theta_spread    := the circular standard deviation of the theta
+                               values of the image.
+            phi_spread      := the standard deviation of the phi values of
+                               the image.
+            lyapunov        := the mean Lyapunov exponent of the sampled
+                               points, per collision. The same for every
+                               iteration of a value of lam.
+            lyapunov_stderr := the standard error of lyapunov.
+    """
+    tasks = [(lam, const, sampleParamLow, sampleParamHi, samples, param, \
+              iterations, sampleType, seed, lyapunovIterations) \
+             for lam in lams]
+    if workers <= 1:
+        results = map(sweepPoint, tasks)
+    else:
+        pool = Pool(workers)
+        try:
+            results = pool.map(sweepPoint, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return [row for rows in results for row in rows]
+
+def sweepPoint(args):
+    """ args := the arguments of sweep for a single value of lam.
+        Returns the rows of the table for that value of lam. This is a
+        module level function so that the process pool can call it.
+    """
+    (lam, const, sampleParamLow, sampleParamHi, samples, param, iterations, \
+     sampleType, seed, lyapunovIterations) = args
+    if const == 'phi':
+        store = image_const_phi(sampleParamLow, sampleParamHi, samples, \
+                                param, iterations, lam, sampleType, seed)
+    elif const == 'theta':
+        store = image_const_theta(sampleParamLow, sampleParamHi, samples, \
+                                  param, iterations, lam, sampleType, seed)
+    else:
+        raise ValueError("Invalid constant parameter " + str(const))
+    # Estimate the exponent from the sampled points themselves.
+    estimate = lyapunov(store.thetaphi[:, 0, 0], store.thetaphi[:, 0, 1], \
+                        lyapunovIterations, lam)
+    rows = []
+    for k in range(iterations + 1):
+        theta = store.thetaphi[:, k, 0]
+        phi = store.thetaphi[:, k, 1]
+        # Collisions that could not be converted are nan and left out.
+        good = ~np.isnan(phi)
+        rows.append((lam, k, circularSpread(theta[good]), \
+                     phi[good].std(), estimate.mean, estimate.stderr))
+    return rows
+
+def circularSpread(angles):
+    """ Returns the circular standard deviation sqrt(-2 ln R) of the angles,
+        R being the length of the mean of the unit vectors with these angles.
+        Close to the usual standard deviation for angles that are close
+        together, and it does not depend on where 0 is.
+    """
+    r = math.hypot(np.cos(angles).mean(), np.sin(angles).mean())
+    if r == 0:
+        return float("inf")
+    return math.sqrt(2*math.log(1/min(r, 1.0)))
+
+def writeTable(rows, filename):
+    """ Writes the table returned by sweep to the csv file 'filename', with
+        the names of the columns on the first line.
+    """
+    with open(filename, "wb") as table:
+        writer = csv.writer(table)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Accumulates the occupancy of collision space for very large ensembles of
+collision points. The seeds are sampled a chunk at a time, and instead of
+keeping the trajectories, every iteration of every chunk is binned into a 2D
+(theta,phi) histogram as soon as it is computed. So the memory used does not
+grow with the number of sampled seeds. Seeds passed in as arrays are only
+converted and iterated a chunk at a time. The histograms are drawn as density
+images. Uses ComputeIteration.py and Plotter.py.
+"""
+from collections import deque
+import gc
+import math
+from multiprocessing import Pool
+import matplotlib.pyplot as plt
+import matplotlib.ticker as tck
+import numpy as np
+from ComputeIteration import sampleChunks
+from ComputeIteration import seedsTOxybeta
+from ComputeIteration import streamTrajectories
+from Plotter import PageWriter, RASTERDPI
+
+# The number of seeds pushed through the collision map at once.
+CHUNK = 100000
+
+def histogram_const_theta(philow, phihigh, samples, theta, iterations, lam, \
+                          sampleType, seed=None, bins=(200, 100), \
+                          chunk=CHUNK, workers=1):
+    """ The arguments up to seed are those of
+        ComputeIteration.image_const_theta, but 'adaptive' sampling is not
+        available.
+        bins    := the number of (theta, phi) bins.
+        chunk   := the number of seeds iterated at once.
+        workers := the number of processes computing the chunks.
+        Returns the histograms of the collisions of every iteration, see
+        phaseHistogram.
+    """
+    seeds = ((theta, phis) for phis in \
+             sampleChunks(philow, phihigh, samples, sampleType, seed, chunk))
+    return phaseHistogram(seeds, iterations, lam, bins, workers)
+
+def histogram_const_phi(thetalow, thetahigh, samples, phi, iterations, lam, \
+                        sampleType, seed=None, bins=(200, 100), chunk=CHUNK, \
+                        workers=1):
+    """ The arguments up to seed are those of
+        ComputeIteration.image_const_phi, but 'adaptive' sampling is not
+        available. See histogram_const_theta for the others.
+        Returns the histograms of the collisions of every iteration, see
+        phaseHistogram.
+    """
+    seeds = ((thetas, phi) for thetas in \
+             sampleChunks(thetalow, thetahigh, samples, sampleType, seed, \
+                          chunk))
+    return phaseHistogram(seeds, iterations, lam, bins, workers)
+
+def histogram_seeds(theta, phi, iterations, lam, bins=(200, 100), \
+                    chunk=CHUNK, workers=1):
+    """ theta, phi := arrays (or numbers) of seeds in collision space, see
+                      ComputeIteration.image_seeds. See
+                      histogram_const_theta for the other arguments.
+        Returns the histograms of the collisions of every iteration, see
+        phaseHistogram.
+    """
+    (theta, phi) = np.broadcast_arrays(np.asarray(theta, dtype=float), \
+                                       np.asarray(phi, dtype=float))
+    # Slices of the flat iterators copy only the seeds of one chunk.
+    seeds = ((theta.flat[a:a + chunk], phi.flat[a:a + chunk]) \
+             for a in range(0, theta.size, chunk))
+    return phaseHistogram(seeds, iterations, lam, bins, workers)
+
+def phaseHistogram(seeds, iterations, lam, bins=(200, 100), workers=1):
+    """ seeds      := iterable of the chunks of seeds, each one a pair
+                      (theta, phi) of arrays (or numbers) of collision space
+                      that are broadcast against each other.
+        iterations := the number of iterations desired.
+        lam        := the parameter that characterizes a Bunimovich Stadium.
+        bins       := the pair (thetaBins, phiBins).
+        workers    := the number of processes computing the chunks.
+        Returns an integer array of shape (iterations+1, thetaBins, phiBins).
+        The [k, i, j] entry is the number of seeds whose k^th collision has
+        theta in the i^th of thetaBins equal parts of [0, 2pi] and phi in
+        the j^th of phiBins equal parts of [-pi/2, pi/2]. Collisions that
+        could not be converted to theta-phi pairs are not counted.
+        The chunks are taken from seeds one at a time, as they are needed,
+        so when seeds is a generator the memory used does not depend on the
+        number of seeds.
+    """
+    counts = np.zeros((iterations + 1,) + tuple(bins), dtype=np.int64)
+    if workers <= 1:
+        for (theta, phi) in seeds:
+            counts += histogramChunk((theta, phi, iterations, lam, bins))
+        return counts
+    pool = Pool(workers)
+    try:
+        # Pool.imap would take every chunk at once. Only a few chunks are
+        # handed out ahead, the counts add up in any order.
+        pending = deque()
+        for (theta, phi) in seeds:
+            pending.append(pool.apply_async(histogramChunk, \
+                                            ((theta, phi, iterations, lam, \
+                                              bins),)))
+            if len(pending) >= 2*workers:
+                counts += pending.popleft().get()
+        while pending:
+            counts += pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+    return counts
+
+def histogramChunk(args):
+    """ args := the tuple (theta, phi, iterations, lam, bins).
+        Returns the histograms of one chunk of seeds, see phaseHistogram.
+        The seeds are only converted to Cartesian coordinates here, and only
+        one iteration of the chunk is held in memory at a time. This is a
+        module level function so that the process pool can call it.
+    """
+    (theta, phi, iterations, lam, bins) = args
+    (x, y, beta) = seedsTOxybeta(theta, phi, lam)
+    counts = np.zeros((iterations + 1,) + tuple(bins), dtype=np.int64)
+    for (k, cartesian, thetaphi) in streamTrajectories(x, y, beta, \
+                                                       iterations, lam):
+        counts[k] = binCollisions(thetaphi, bins)
+    return counts
+
+def histogramStore(store, bins=(200, 100), chunk=CHUNK):
+    """ store := a TrajectoryStore, e.g. a MappedTrajectoryStore too large
+                 for memory.
+        bins  := the pair (thetaBins, phiBins).
+        chunk := the number of samples read at once.
+        Returns the histograms of the collisions of every iteration of
+        store, see phaseHistogram. Only 'chunk' collisions of one iteration
+        are read into memory at a time.
+    """
+    counts = np.zeros((store.iterations + 1,) + tuple(bins), dtype=np.int64)
+    for k in range(store.iterations + 1):
+        for a in range(0, store.samples, chunk):
+            counts[k] += binCollisions(store.thetaphi[a:a + chunk, k], bins)
+    return counts
+
+def binCollisions(thetaphi, bins):
+    """ thetaphi := array of shape (collisions, 2) of theta-phi pairs.
+        bins     := the pair (thetaBins, phiBins).
+        Returns the (thetaBins, phiBins) histogram of the collisions, see
+        phaseHistogram.
+    """
+    (thetaBins, phiBins) = bins
+    theta = thetaphi[:, 0]
+    phi = thetaphi[:, 1]
+    good = ~np.isnan(phi)
+    # Find the bin of every collision. The upper ends theta = 2pi and
+    # phi = pi/2 belong to the last bins.
+    i = np.minimum((theta[good]/(2*math.pi)*thetaBins).astype(int), \
+                   thetaBins - 1)
+    j = np.minimum(((phi[good] + math.pi/2)/math.pi*phiBins).astype(int), \
+                   phiBins - 1)
+    return np.bincount(i*phiBins + j, minlength=thetaBins*phiBins) \
+           .reshape(thetaBins, phiBins)
+
+def densityView(counts, pages, save):
+    """ counts := the histograms returned by phaseHistogram.
+        pages  := the iterations to be drawn, one page each.
+        save   := function called with the figure once each page is drawn.
+        Draws the histogram of every iteration as an image of the fraction
+        of the collisions falling in each bin. The axes are those of the
+        cylinder view of Plotter.py. Can be used as a view of
+        Plotter.PageWriter.
+    """
+    fig = plt.figure(figsize=(6,4))
+    ax = plt.subplot(111)
+    title = plt.suptitle("", fontsize=16)
+
+    ax.yaxis.set_major_formatter(tck.FormatStrFormatter('%g $\pi$'))
+    ax.yaxis.set_major_locator(tck.MultipleLocator(base=1.0))
+    ax.xaxis.set_major_formatter(tck.FormatStrFormatter('%g $\pi$'))
+    ax.xaxis.set_major_locator(tck.MultipleLocator(base=1.0))
+
+    # Rows of the image are phi bins, columns are theta bins. As in the
+    # cylinder view phi is shifted up by pi/2.
+    image = ax.imshow(np.zeros(counts.shape[2:0:-1]), origin="lower", \
+                      extent=[0, 2, 0, 1], aspect="auto", cmap="viridis", \
+                      interpolation="nearest")
+    bar = fig.colorbar(image, ax=ax)
+    bar.set_label("fraction of collisions")
+
+    for iteration in pages:
+        title.set_text("Iteration " + str(iteration))
+        total = max(counts[iteration].sum(), 1)
+        density = counts[iteration].T/float(total)
+        image.set_data(density)
+        image.set_clim(0, max(density.max(), 1.0/total))
+        save(fig)
+    plt.close(fig)
+    gc.collect()
+
+def plotDensity(counts, start, name, output="pdf", dpi=RASTERDPI):
+    """ counts := the histograms returned by phaseHistogram.
+        start  := the first iteration to be drawn.
+        name   := the end of the name of the output file(s).
+        output := how the pages are written, see Plotter.PageWriter.
+        dpi    := the resolution of rasterized output.
+        Draws the histograms of the iterations from start on into the
+        output "density" + name.
+    """
+    pages = range(start, counts.shape[0])
+    writer = PageWriter("density" + name, pages, output, dpi)
+    densityView(counts, pages, writer.save)
+    writer.close()
+    print "Density Plotting Complete"
@@ -8,18 +8,30 @@ ComputeIteration.py
 """
 
 import gc
+import warnings
+import traceback
 from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import matplotlib.pyplot as plt
 import matplotlib.ticker as tck
 import matplotlib.patches as mpatches
+import matplotlib.animation as animation
+from matplotlib.collections import LineCollection
 from mpl_toolkits import mplot3d
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
 from ComputeIteration import image_const_phi
 from ComputeIteration import image_const_theta
+from multiprocessing import Pool
 import math
 import numpy as np
 
+# Default resolution of rasterized output, in dots per inch.
+RASTERDPI = 200
+
 def plotter(const, samples, sampleParamLow, sampleParamHi, param, \
-                    iterations, start, lam, sampleType, plotType):
+                    iterations, start, lam, sampleType, plotType, seed=None, \
+                    workers=1, cache=None, pageWorkers=1, output="pdf", \
+                    dpi=RASTERDPI, progress=None):
     """ const          := is 'phi' (constant phi) xor 'theta' (constant theta).
         samples        := the number of samples of the parameter to be varied.
         sampleParamLow := lower bound for sampled values of the varied param.
@@ -30,6 +42,10 @@ def plotter(const, samples, sampleParamLow, sampleParamHi, param, \
         sampleType     := the type of technique to use for sampling.
                           'even' for evenly spaced
                           'random' for uniformly random
+                          'halton' for a low-discrepancy sequence
+                          'stratified' for one random value per cell
+                          'adaptive' for more samples where the images
+                          of neighbouring samples are far apart
         plotType       := which type of plot(s) is/are to be produced.
                        possible values:
                            'c'   for cylinder view only
@@ -39,237 +55,559 @@ def plotter(const, samples, sampleParamLow, sampleParamHi, param, \
                            'cb'  for cylinder and stadia views
                            'sb'  for spherical and stadia views
                            'csb' for all three views
+        seed           := seed for the 'random' and 'stratified' sampling
+                          techniques.
+        workers        := the number of processes computing the trajectories.
+        cache          := optional ResultCache holding the trajectories of
+                          earlier calls.
+        pageWorkers    := the number of processes drawing the pages. With
+                          more than one the pages are rasterized.
+        output         := how the pages are written.
+                           'pdf'       for a vector pdf per view
+                           'rasterpdf' for a pdf per view with rasterized
+                                       segments, arrows and sphere
+                           'png'       for a png per view and iteration
+                           'gif'       for an animated gif per view
+                           'mp4'       for a movie per view
+        dpi            := the resolution of rasterized output.
+        progress       := optional function called as progress(message) as
+                          the work advances and as progress(message, name)
+                          once a view is written to the output 'name'.
                            
     """
     pi = math.pi # We can always use some pi!
+    if progress is None:
+        progress = ignoreProgress
     
     ## Generate the data to be used in all plot views ##
     if const == 'phi':
         # the constant parameter is phi, the varied parameter is theta.
         var = 'theta'
-        images, cartesianImage = image_const_phi(sampleParamLow, \
-                sampleParamHi, samples, param, iterations,  lam, sampleType)
+        compute = image_const_phi
                                             
     elif const == 'theta':
         # the constant parameter is theta, the varied parameter is phi.
         var = 'phi'
-        images, cartesianImage = image_const_theta(sampleParamLow, \
-                sampleParamHi, samples, param, iterations,  lam, sampleType)
+        compute = image_const_theta
     else:
         print "Invalid constant parameter."
     
+    progress("Computing trajectories...")
+    if cache is not None:
+        # Reuse the trajectories of an earlier call with the same arguments.
+        store = cache.image(const, sampleParamLow, sampleParamHi, samples, \
+                            param, iterations, lam, sampleType, seed, workers)
+    else:
+        store = compute(sampleParamLow, sampleParamHi, samples, param, \
+                        iterations, lam, sampleType, seed, workers)
+    
     print "Computation finished, preparing image..."
+    progress("Computation finished, preparing image...")
     
-    ## Create a string to uniquely name the output pdf ##
+    ## Create a string to uniquely name the output files ##
     name = "const_" + const + "_" + str(param) + "_samples_" + str(samples) + \
            "_" + var + "_" + str(sampleParamLow) + "to" + str(sampleParamHi)
     name = "_" + name + "iters_" + str(iterations) + "_sType_" + sampleType
+    name = name + "_lam_" + str(lam)
+    # Runs that differ only in these must not write to the same files.
+    if seed is not None:
+        name = name + "_seed_" + str(seed)
+    if start != 0:
+        name = name + "_start_" + str(start)
+    # Movie writers grab every frame from one figure, so animated output is
+    # always drawn here.
+    parallel = pageWorkers > 1 and output not in MOVIEWRITERS
+    # The same for different kinds of output. A movie that falls back to
+    # png frames keeps its own name too.
+    if output != "pdf":
+        name = name + "_" + output
+    if parallel:
+        # The page pool rasterizes whole pages.
+        name = name + "_raster"
     
+    ## Draw the requested views, one page per iteration ##
+    pages = range(start, iterations)
+    # The views in the order they are produced.
+    views = [view for view in "cbs" if view in plotType]
+    if parallel:
+        renderParallel(store, views, pages, name, pageWorkers, output, dpi, \
+                       progress)
+    else:
+        for view in views:
+            (prefix, draw, message) = VIEWS[view]
+            # Create the output
+            writer = PageWriter(prefix + name, pages, output, dpi, \
+                                pageProgress(progress, prefix))
+            draw(store, pages, writer.save)
+            writer.close()
+            print message
+            progress(message, writer.filename)
+    return 1
+
+def ignoreProgress(message, name=None):
+    """ The progress function of plotter when none is given.
+    """
+    pass
+
+def pageProgress(progress, prefix):
+    """ Returns the function reporting to progress that a page of the view
+        whose output starts with prefix has been written.
+    """
+    return lambda iteration: progress(prefix + " view: iteration " + \
+                                      str(iteration) + " written")
+
+
 ## ---------------------- CYLINDER VIEW ------------------------------ ##
-    # Check if the cylinder view is to be presented.
-    if "c" in plotType:
-        # Create a pdf for output
-        ppC = PdfPages("cylinder" + name + ".pdf")
-        # Proceed to present the cylinder view.
-        for iteration in range(start ,iterations):
-            fig = plt.figure(figsize=(6,4))
-            ax = plt.subplot(111)
-            plt.suptitle("Iteration " + str(iteration), fontsize=16)
-            
-            ax.yaxis.set_major_formatter(tck.FormatStrFormatter('%g $\pi$'))
-            ax.yaxis.set_major_locator(tck.MultipleLocator(base=1.0))
-            ax.xaxis.set_major_formatter(tck.FormatStrFormatter('%g $\pi$'))
-            ax.xaxis.set_major_locator(tck.MultipleLocator(base=1.0))
-            
-            ax.set_xlim([-0.01, 2])
-            ax.set_ylim([0, 1])
-            ax.plot(0, 0, ms=0)
-            
-            points = images[iteration]
-            # Go through the points plotting them as we go
-            for i in range(1,samples):
-                dist = abs(points[i-1][0] - points[i][0])
-                # See if the regular distance is shorter than the compliment of
-                # the distances.
-                if dist < (2*pi - dist):
-                    # "no wrapping"
-                    # The points must be plotted normally
-                    x = [points[i-1][0]/pi, points[i][0]/pi]
-                    y = [(points[i-1][1] + pi/2)/pi, (points[i][1] + pi/2)/pi]
-                    plt.plot(x, y)#33333333333333333333333333333333333333333333333
-                else:
-                    # "wrapping"
-                    # The points must be plotted so that the line between them
-                    # goes the "other way" around the cylinder.
-                    # Get the average of the two psi values of the points.
-                    # Then shift up by pi/2 to turn the phi value into a psi
-                    # value.
-                    psiaverage = (points[i-1][1] + points[i][1])/2 + pi/2
-                    # Figure out which point has a higher theta value
-                    if points[i-1][0] < points[i][0]:
+def cylinderView(store, pages, save):
+    """ store := the TrajectoryStore to be drawn.
+        pages := the iterations to be drawn, one page each.
+        save  := function called with the figure once each page is drawn.
+        Draws the cylinder view.
+    """
+    cycle = np.array(plt.rcParams['axes.prop_cycle'].by_key()['color'])
+    linewidth = plt.rcParams['lines.linewidth']
+    # Proceed to present the cylinder view. The figure and the axes are
+    # made once and reused for every iteration.
+    fig = plt.figure(figsize=(6,4))
+    ax = plt.subplot(111)
+    title = plt.suptitle("", fontsize=16)
+    
+    ax.yaxis.set_major_formatter(tck.FormatStrFormatter('%g $\pi$'))
+    ax.yaxis.set_major_locator(tck.MultipleLocator(base=1.0))
+    ax.xaxis.set_major_formatter(tck.FormatStrFormatter('%g $\pi$'))
+    ax.xaxis.set_major_locator(tck.MultipleLocator(base=1.0))
     
-                        #p_i has a higher theta value, it must be connected to
-                        #(2pi, psiaverage)
-                        x = [points[i][0]/pi, 2]
-                        y = [(points[i][1] + pi/2)/pi, psiaverage/pi]
-                        plt.plot(x, y)################################################
-                        #p_i-1 has a lower theta value, it must be connected to
-                        #(0, psiaverage)
-                        x = [0, points[i-1][0]/pi]
-                        y = [psiaverage/pi, (points[i-1][1] + pi/2)/pi]
-                        plt.plot(x, y)############################################
-                    else:
-                        #p_i has a lower theta value so it must be connected to
-                        #(0, psiaverage)
-                        x = [0, points[i][0]/pi]
-                        y = [psiaverage/pi, (points[i][1] + pi/2)/pi]
-                        plt.plot(x, y)##################################################
-                        #p_i-1 has a higher theta value,it must be connected to
-                        #(2pi, psiaverage)
-                        x = [points[i-1][0]/pi, 2]
-                        y = [(points[i-1][1] + pi/2)/pi, psiaverage/pi]
-                        plt.plot(x, y)################################################# 'r'
-            ppC.savefig(fig)
-            plt.close(fig)
-            gc.collect()
-        ppC.close()
-        print "Cylinder Plotting Complete"
+    ax.set_xlim([-0.01, 2])
+    ax.set_ylim([0, 1])
+    ax.plot(0, 0, ms=0)
+    
+    for iteration in pages:
+        title.set_text("Iteration " + str(iteration))
+        # The theta-phi pairs of every sample at this iteration.
+        points = store.thetaphi[:, iteration]
+        # Draw every segment between consecutive points as one artist.
+        # Each segment gets the next color of the color cycle, just
+        # like separate calls to plot. The invisible marker at the
+        # origin has already used the first color.
+        segments = cylinderSegments(points)
+        colors = np.roll(cycle, -1)[np.arange(len(segments)) % len(cycle)]
+        lines = LineCollection(segments, colors=colors, \
+                               linewidths=linewidth, capstyle='projecting')
+        ax.add_collection(lines)
+        save(fig)
+        lines.remove()
+    plt.close(fig)
+    gc.collect()
+
+## ---------------------- STADIA VIEW ------------------------------ ##
+def stadiaView(store, pages, save):
+    """ store := the TrajectoryStore to be drawn.
+        pages := the iterations to be drawn, one page each.
+        save  := function called with the figure once each page is drawn.
+        Draws the stadia view.
+    """
+    # Proceed to present the stadia view. The figure and the walls of
+    # the stadium are made once and reused for every iteration.
+    fig = plt.figure(figsize=(6,4))
+    x1, y1 = [-1, 1], [1, 1]
+    x2, y2 = [-1, 1], [-1, -1]
+    plt.plot(x1, y1, c='b')
+    plt.plot(x2, y2, c='b')
+    title = plt.suptitle("", fontsize=16)
+    
+    ax = plt.subplot(111)
+    rightCap = mpatches.Wedge((1, 0), 1, -90, 90, width=.015, fc='b')
+    leftCap = mpatches.Wedge((-1, 0), 1, 90, -90, width=.015, fc='b')
+    
+    ax.plot(0, 0, ms=0)
+    ax.add_artist(rightCap)
+    ax.add_artist(leftCap)
 
-## ---------------------- STADIA VIEW ------------------------------ ##       
-    if "b" in plotType:
-        # Create a pdf for output
-        ppB = PdfPages("stadia" + name + ".pdf")
-        # Proceed to present the stadia view.
-        fig = plt.figure(figsize=(6,4))
-        x1, y1 = [-1, 1], [1, 1]
-        x2, y2 = [-1, 1], [-1, -1]
-        plt.plot(x1, y1, c='b')
-        plt.plot(x2, y2, c='b')
-        
-        ax = plt.subplot(111)
-        rightCap = mpatches.Wedge((1, 0), 1, -90, 90, width=.015, fc='b')
-        leftCap = mpatches.Wedge((-1, 0), 1, 90, -90, width=.015, fc='b')
-        
-        ax.plot(0, 0, ms=0)
-        ax.add_artist(rightCap)
-        ax.add_artist(leftCap)
+    ax.set_xlim([-2.1, 2.1])
+    ax.set_ylim([-1.5, 1.5])
+    ax.plot(0, 0, ms=0)
     
-        ax.set_xlim([-2.1, 2.1])
-        ax.set_ylim([-1.5, 1.5])
-        ax.plot(0, 0, ms=0)
-        
-        for iteration in range(start, iterations):
-            fig = plt.figure(figsize=(6,4))
-            x1, y1 = [-1, 1], [1, 1]
-            x2, y2 = [-1, 1], [-1, -1]
-            plt.plot(x1, y1, c='b')
-            plt.plot(x2, y2, c='b')
-            plt.suptitle("Iteration " + str(iteration), fontsize=16)
-            
-            ax = plt.subplot(111)
-            rightCap = mpatches.Wedge((1, 0), 1, -90, 90, width=.015, fc='b')
-            leftCap = mpatches.Wedge((-1, 0), 1, 90, -90, width=.015, fc='b')
-            
-            ax.plot(0, 0, ms=0)
-            ax.add_artist(rightCap)
-            ax.add_artist(leftCap)
-        
-            ax.set_xlim([-2.1, 2.1])
-            ax.set_ylim([-1.5, 1.5])
-            ax.plot(0, 0, ms=0)
-            for sample in range(samples):
-                x = [cartesianImage[sample][iteration][0], \
-                     cartesianImage[sample][iteration+1][0]]
-                y = [cartesianImage[sample][iteration][1], \
-                     cartesianImage[sample][iteration+1][1]]
-                print 'x = ' + str(x)
-                print 'y = ' + str(y)
-                plt.arrow(x[0], y[0], (x[1]-x[0]), (y[1]-y[0]), color = 'r', \
-                    length_includes_head = True, shape='full', head_width=.05)
-            ppB.savefig(fig)
-        #    plt.close(fig)
-        #    gc.collect()
-        ppB.close()
-        print "Stadia Plotting Complete."
-            
+    for iteration in pages:
+        title.set_text("Iteration " + str(iteration))
+        # Every chord from a collision to the next one is drawn by a
+        # single quiver. The arrows are in data units so that they end
+        # exactly on the next collision and they look like those of
+        # plt.arrow(..., head_width=.05), outline included. They are
+        # drawn over the caps and under the flat walls, as before.
+        (x, y) = (store.cartesian[:, iteration, 0], \
+                  store.cartesian[:, iteration, 1])
+        (dx, dy) = (store.cartesian[:, iteration+1, 0] - x, \
+                    store.cartesian[:, iteration+1, 1] - y)
+        arrows = ax.quiver(x, y, dx, dy, color='r', angles='xy', \
+                           scale_units='xy', scale=1, units='xy', \
+                           width=.001, headwidth=50, headlength=75, \
+                           headaxislength=75, edgecolor='r', \
+                           linewidth=plt.rcParams['patch.linewidth'], \
+                           zorder=1.5)
+        save(fig)
+        arrows.remove()
+    plt.close(fig)
+    gc.collect()
+
 ## ---------------------- SPHERICAL VIEW ------------------------------ ##
-    if "s" in plotType:
-        # Create a sphere
-        ppS = PdfPages("sphere" + name + ".pdf")
-        r = 1
-        pi = np.pi
-        cos = np.cos
-        sin = np.sin
-        phi, theta = np.mgrid[0.0:pi:100j, 0.0:2.0*pi:100j]
-        xxx = r*sin(phi)*cos(theta)
-        yyy = r*sin(phi)*sin(theta)
-        zzz = r*cos(phi)
-        
-        for iteration in range(start ,iterations):
-            points = images[iteration]
-            fig = plt.figure()
-            ax = fig.add_subplot(111, projection='3d')
+def sphereView(store, pages, save):
+    """ store := the TrajectoryStore to be drawn.
+        pages := the iterations to be drawn, one page each.
+        save  := function called with the figure once each page is drawn.
+        Draws the spherical view.
+    """
+    # Create a sphere
+    r = 1
+    pi = np.pi
+    cos = np.cos
+    sin = np.sin
+    phi, theta = np.mgrid[0.0:pi:100j, 0.0:2.0*pi:100j]
+    xxx = r*sin(phi)*cos(theta)
+    yyy = r*sin(phi)*sin(theta)
+    zzz = r*cos(phi)
     
-            ax.plot_surface(xxx, yyy, zzz,  rstride=1, cstride=1, color='c', \
-                            alpha=0.3, linewidth=0)
-            # Go through the points plotting them as we go
-            for i in range(1,samples):
-                # Get the theta and phi values
-                theta_im1 = points[i-1][0]
-                theta_i   = points[i][0]
-                phi_im1   = points[i-1][1] + pi/2
-                phi_i     = points[i][1] + pi/2
-                # Calculate the 3d Cartesian values corresponding to the
-                # theta phi values.
-                xx_im1    = math.sin(phi_im1)*math.cos(theta_im1)
-                xx_i      = math.sin(phi_i)*math.cos(theta_i)
-                yy_im1    = math.sin(phi_im1)*math.sin(theta_im1)
-                yy_i      = math.sin(phi_i)*math.sin(theta_i)
-                zz_im1    = math.cos(phi_im1)
-                zz_i      = math.cos(phi_i)
-                
-                dist = abs(points[i-1][0] - points[i][0])
-                # See if the regular distance is shorter than the compliment of
-                # the distances.
-                if dist < (2*pi - dist):
-                    # "no wrapping"
-                    # The points must be plotted normally
-                    x = [xx_im1, xx_i]
-                    y = [yy_im1, yy_i]
-                    z = [zz_im1, zz_i]
-                    ax.plot3D(x,y,z)
-                else:
-                    # "wrapping"
-                    # The points must be plotted so that the line between them
-                    # goes the "other way" around the cylinder.
-                    # Get the average of the two psi values of the points.
-                    # Create an intermediate point to prevent wrapping it
-                    # has a theta value of 0.
-                    phiaverage = (points[i-1][1] + points[i][1])/2 + pi/2
-                    xx0 = math.sin(phiaverage)
-                    yy0 = 0
-                    zz0 = math.cos(phiaverage)
-                    
-                    # Connect p_i-1 to xx0 and plot
-                    x = [xx_im1, xx0]
-                    y = [yy_im1, yy0]
-                    z = [zz_im1, zz0]
-                    ax.plot3D(x,y,z)
-                    
-                    # Connect p_i to xx0 and plot
-                    x = [xx_i, xx0]
-                    y = [yy_i, yy0]
-                    z = [zz_i, zz0]
-                    ax.plot3D(x,y,z)
+    # The figure and the sphere are made once and reused for every
+    # iteration. Only the segments are replaced.
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    ax.plot_surface(xxx, yyy, zzz,  rstride=1, cstride=1, color='c', \
+                    alpha=0.3, linewidth=0)
+    ax.set_xlim([-1,1])
+    ax.set_ylim([-1,1])
+    ax.set_zlim([-1,1])
+    ax.set_aspect("equal")
+    plt.tight_layout()
+    cycle = np.array(plt.rcParams['axes.prop_cycle'].by_key()['color'])
+    linewidth = plt.rcParams['lines.linewidth']
     
-            ax.set_xlim([-1,1])
-            ax.set_ylim([-1,1])
-            ax.set_zlim([-1,1])
-            ax.set_aspect("equal")
-            plt.tight_layout()
-            ppS.savefig(fig)
-            plt.close(fig)
-            gc.collect()
-        ppS.close()           
-        print "Spherical Plotting Complete"
-    return 1
\ No newline at end of file
+    for iteration in pages:
+        points = store.thetaphi[:, iteration]
+        # Draw every segment between consecutive points as one artist.
+        # Each segment gets the next color of the color cycle, just like
+        # separate calls to plot3D.
+        segments = sphereSegments(points)
+        colors = cycle[np.arange(len(segments)) % len(cycle)]
+        lines = SegmentCollection(segments, colors=colors, \
+                                  linewidths=linewidth, \
+                                  capstyle='projecting')
+        ax.add_collection3d(lines)
+        save(fig)
+        lines.remove()
+    plt.close(fig)
+    gc.collect()
+
+# For each view in plotType: the start of the name of its pdf, the function
+# drawing it and the message printed once it is done.
+VIEWS = {"c": ("cylinder", cylinderView, "Cylinder Plotting Complete"), \
+         "b": ("stadia", stadiaView, "Stadia Plotting Complete."), \
+         "s": ("sphere", sphereView, "Spherical Plotting Complete")}
+
+## ---------------------- OUTPUT ------------------------------ ##
+# The matplotlib movie writers able to write each animated output, the
+# preferred one first.
+MOVIEWRITERS = {"gif": ("pillow", "imagemagick"), "mp4": ("ffmpeg",)}
+# Iterations shown per second in animated output.
+FRAMERATE = 2
+
+class PageWriter(object):
+    """ base     := the name of the output without the extension.
+        pages    := the iterations that will be saved, in order.
+        output   := how the pages are written.
+                    'pdf'       for a vector pdf
+                    'rasterpdf' for a pdf whose data layers (the segments,
+                                arrows and sphere) are rasterized
+                    'png'       for one png image per iteration
+                    'gif'       for an animated gif
+                    'mp4'       for a movie
+        dpi      := the resolution of everything that is rasterized.
+        progress := optional function called with the iteration once its
+                    page is written.
+        Writes the pages of one view, filename is the name of the output.
+        The frames of 'gif' and 'mp4' are all grabbed from the figure of the
+        first page, so the view has to draw every page on the same figure.
+        When no movie writer for 'gif' or 'mp4' is installed the frames are
+        written as png images instead.
+    """
+    def __init__(self, base, pages, output="pdf", dpi=RASTERDPI, \
+                 progress=None):
+        self.base = base
+        self.progress = progress
+        self.pages = iter(pages)
+        self.output = output
+        self.dpi = dpi
+        self.pdf = None
+        self.movie = None
+        if output in ("pdf", "rasterpdf"):
+            self.pdf = PdfPages(base + ".pdf")
+        elif output in MOVIEWRITERS:
+            available = [writer for writer in MOVIEWRITERS[output] \
+                         if animation.writers.is_available(writer)]
+            if available:
+                self.movie = animation.writers[available[0]](fps=FRAMERATE)
+            else:
+                print "No " + output + " writer found, writing png frames."
+                self.output = "png"
+        elif output != "png":
+            raise ValueError("Unknown output " + str(output))
+        # True once the movie is bound to the figure of the first page.
+        self.started = False
+        if self.output == "png":
+            self.filename = self.frameName("*")
+        else:
+            self.filename = base + "." + self.output.replace("raster", "")
+
+    def save(self, fig):
+        """ Saves the figure as the page of the next iteration.
+        """
+        iteration = next(self.pages)
+        if self.output == "png":
+            fig.savefig(self.frameName(iteration), dpi=self.dpi)
+        elif self.movie is not None:
+            if not self.started:
+                self.movie.setup(fig, self.base + "." + self.output, \
+                                 self.dpi)
+                self.started = True
+            self.movie.grab_frame()
+        elif self.output == "rasterpdf":
+            # Only the collections hold many elements. The axes, labels and
+            # walls of the stadium stay vector graphics.
+            with warnings.catch_warnings():
+                # The 3d collections are rasterized by their 2d base class,
+                # but matplotlib warns that they will not be.
+                warnings.simplefilter("ignore", UserWarning)
+                for ax in fig.axes:
+                    for collection in ax.collections:
+                        collection.set_rasterized(True)
+            self.pdf.savefig(fig, dpi=self.dpi)
+        else:
+            self.pdf.savefig(fig)
+        self.pageWritten(iteration)
+
+    def saveImage(self, image):
+        """ Saves the RGBA array image, a page rasterized at dpi, as the page
+            of the next iteration.
+        """
+        iteration = next(self.pages)
+        if self.output == "png":
+            plt.imsave(self.frameName(iteration), image)
+            self.pageWritten(iteration)
+            return
+        (height, width) = image.shape[:2]
+        fig = plt.figure(figsize=(float(width)/self.dpi, \
+                                  float(height)/self.dpi))
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.axis("off")
+        # The image is embedded as it is, without resampling.
+        ax.imshow(image, interpolation="none", aspect="auto")
+        self.pdf.savefig(fig)
+        plt.close(fig)
+        self.pageWritten(iteration)
+
+    def pageWritten(self, iteration):
+        """ Reports that the page of an iteration has been written.
+        """
+        if self.progress is not None:
+            self.progress(iteration)
+
+    def frameName(self, iteration):
+        """ Returns the name of the png of an iteration.
+        """
+        return self.base + "_iter_" + str(iteration) + ".png"
+
+    def close(self):
+        """ Finishes the output.
+        """
+        if self.pdf is not None:
+            self.pdf.close()
+        if self.started:
+            self.movie.finish()
+
+## ---------------------- PARALLEL RENDERING ------------------------------ ##
+def renderParallel(store, views, pages, name, workers, output="pdf", \
+                   dpi=RASTERDPI, progress=ignoreProgress):
+    """ store    := the TrajectoryStore to be drawn.
+        views    := the views to be drawn, as in plotType.
+        pages    := the iterations to be drawn, one page each.
+        name     := the end of the names of the output files.
+        workers  := the number of processes drawing the pages.
+        output   := how the pages are written, see PageWriter.
+        dpi      := the resolution of the pages.
+        progress := the progress function of plotter.
+        Draws the views in a pool of processes. The pages of every view are
+        split into one chunk per worker. The workers rasterize their pages
+        and the pages are written in iteration order as soon as they arrive.
+    """
+    bounds = np.linspace(0, len(pages), workers + 1).astype(int)
+    chunks = [(view, pages[a:b], dpi) for view in views \
+              for (a, b) in zip(bounds[:-1], bounds[1:]) if b > a]
+    writers = dict((view, PageWriter(VIEWS[view][0] + name, pages, output, \
+                                     dpi, pageProgress(progress, \
+                                                       VIEWS[view][0]))) \
+                   for view in views)
+    # The store is sent to each worker once, not with every chunk.
+    pool = Pool(workers, initializer=setPageStore, initargs=(store,))
+    try:
+        for (view, images) in pool.imap(renderChunk, chunks):
+            for image in images:
+                writers[view].saveImage(image)
+    finally:
+        pool.close()
+        pool.join()
+    for view in views:
+        writers[view].close()
+        print VIEWS[view][2]
+        progress(VIEWS[view][2], writers[view].filename)
+
+# The TrajectoryStore drawn by the worker processes of renderParallel.
+pageStore = None
+
+def setPageStore(store):
+    """ Initializes a worker process of renderParallel.
+    """
+    global pageStore
+    pageStore = store
+    # The workers never show a window.
+    plt.switch_backend("Agg")
+
+def renderChunk(args):
+    """ args := the tuple (view, pages, dpi).
+        Draws the given pages of a view and returns the pair (view, images)
+        where images is the list of the pages as RGBA arrays. This is a
+        module level function so that the process pool can call it.
+    """
+    (view, pages, dpi) = args
+    images = []
+    VIEWS[view][1](pageStore, pages, \
+                   lambda fig: images.append(rasterize(fig, dpi)))
+    return (view, images)
+
+def rasterize(fig, dpi):
+    """ Returns the figure drawn at dpi dots per inch as an RGBA array.
+    """
+    fig.set_dpi(dpi)
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    (width, height) = canvas.get_width_height()
+    buf = np.frombuffer(canvas.buffer_rgba(), np.uint8)
+    return buf.reshape(height, width, 4).copy()
+
+## ---------------------- BACKGROUND PLOTTING ------------------------------ ##
+def plotInBackground(queue, args, kwargs):
+    """ queue  := a multiprocessing Queue.
+        args   := the positional arguments of plotter.
+        kwargs := the keyword arguments of plotter, except progress.
+        Runs plotter, meant as the target of a multiprocessing Process so
+        that a GUI stays responsive and can terminate the work. Puts the
+        progress of plotter on the queue as pairs (kind, text):
+            ("progress", message) as the work advances
+            ("view", name)        once a view is written to the output name
+            ("done", None)        once plotter has finished
+            ("error", traceback)  if plotter failed
+    """
+    # Nothing is shown, so no display is needed.
+    plt.switch_backend("Agg")
+    def progress(message, name=None):
+        if name is None:
+            queue.put(("progress", message))
+        else:
+            queue.put(("view", name))
+    try:
+        plotter(*args, progress=progress, **kwargs)
+    except Exception:
+        queue.put(("error", traceback.format_exc()))
+    else:
+        queue.put(("done", None))
+
+
+def cylinderSegments(points):
+    """ points := (samples, 2) array of theta-phi pairs.
+        Returns a (segments, 2, 2) array of the line segments joining
+        consecutive points in the cylinder view, in the order they are drawn.
+        The coordinates are (theta/pi, psi/pi) with psi = phi + pi/2. Two
+        points are joined the short way around the cylinder. When that is
+        across theta = 0 the pair gives two segments, one from each point to
+        the edge of the view at the average psi.
+    """
+    pi = math.pi
+    theta = points[:, 0]/pi
+    psi = (points[:, 1] + pi/2)/pi
+    (theta0, theta1) = (theta[:-1], theta[1:])
+    (psi0, psi1) = (psi[:-1], psi[1:])
+    # Distances are in units of pi, so going around the cylinder is 2.
+    dist = abs(theta0 - theta1)
+    wrap = dist >= (2 - dist)
+    psiaverage = (psi0 + psi1)/2
+    # Room for two segments per pair, [pair, segment, endpoint, coordinate].
+    pairs = np.empty((theta0.size, 2, 2, 2))
+    # "no wrapping", the points are joined directly.
+    pairs[:, 0, 0, 0] = theta0
+    pairs[:, 0, 0, 1] = psi0
+    pairs[:, 0, 1, 0] = theta1
+    pairs[:, 0, 1, 1] = psi1
+    # "wrapping", p_i is joined to the edge nearest to it first and then
+    # p_i-1 to the other edge. The edge point is first when it is (0, psi).
+    # If p_i has a higher theta value it goes to (2, psiaverage) and p_i-1
+    # goes to (0, psiaverage), otherwise the other way around.
+    higher = theta0 < theta1
+    edge1 = np.where(higher, 2.0, 0.0)
+    edge0 = 2 - edge1
+    w = np.nonzero(wrap)[0]
+    h = higher[w]
+    # Segment from p_i to its edge.
+    pairs[w, 0, 0, 0] = np.where(h, theta1[w], edge1[w])
+    pairs[w, 0, 0, 1] = np.where(h, psi1[w], psiaverage[w])
+    pairs[w, 0, 1, 0] = np.where(h, edge1[w], theta1[w])
+    pairs[w, 0, 1, 1] = np.where(h, psiaverage[w], psi1[w])
+    # Segment from p_i-1 to its edge.
+    pairs[w, 1, 0, 0] = np.where(h, edge0[w], theta0[w])
+    pairs[w, 1, 0, 1] = np.where(h, psiaverage[w], psi0[w])
+    pairs[w, 1, 1, 0] = np.where(h, theta0[w], edge0[w])
+    pairs[w, 1, 1, 1] = np.where(h, psi0[w], psiaverage[w])
+    # Keep the second segment only for the pairs that wrap.
+    keep = np.column_stack((np.ones(theta0.size, bool), wrap)).ravel()
+    return pairs.reshape(-1, 2, 2)[keep]
+
+class SegmentCollection(Line3DCollection):
+    """ A Line3DCollection that is always drawn after the other collections
+        of its axes. The segments are then drawn on top of the transparent
+        sphere, as separate Line3D artists would be, instead of being sorted
+        by depth against it.
+    """
+    def do_3d_projection(self, renderer):
+        Line3DCollection.do_3d_projection(self, renderer)
+        # The collections are drawn from the largest value to the smallest.
+        return -np.inf
+
+def sphereSegments(points):
+    """ points := (samples, 2) array of theta-phi pairs.
+        Returns a (segments, 2, 3) array of the line segments joining
+        consecutive points in the spherical view, in the order they are
+        drawn. A point is placed on the unit sphere with theta as the
+        azimuth and phi + pi/2 as the polar angle. When the short way between
+        two points crosses theta = 0 the pair gives two segments, one from
+        each point to an intermediate point at theta = 0 and the average
+        polar angle.
+    """
+    pi = math.pi
+    theta = points[:, 0]
+    polar = points[:, 1] + pi/2
+    # The 3d Cartesian values corresponding to the theta phi values.
+    xyz = np.column_stack((np.sin(polar)*np.cos(theta), \
+                           np.sin(polar)*np.sin(theta), np.cos(polar)))
+    dist = abs(theta[:-1] - theta[1:])
+    wrap = dist >= (2*pi - dist)
+    # Room for two segments per pair, [pair, segment, endpoint, coordinate].
+    pairs = np.empty((dist.size, 2, 2, 3))
+    # "no wrapping", p_i-1 is joined to p_i. With wrapping p_i-1 is joined
+    # to the intermediate point and then p_i is.
+    pairs[:, 0, 0] = xyz[:-1]
+    pairs[:, 0, 1] = xyz[1:]
+    pairs[:, 1, 0] = xyz[1:]
+    average = (polar[:-1] + polar[1:])/2
+    middle = np.column_stack((np.sin(average), np.zeros(dist.size), \
+                              np.cos(average)))
+    pairs[wrap, 0, 1] = middle[wrap]
+    pairs[:, 1, 1] = middle
+    # Keep the second segment only for the pairs that wrap.
+    keep = np.column_stack((np.ones(dist.size, bool), wrap)).ravel()
+    return pairs.reshape(-1, 2, 3)[keep]
\ No newline at end of file
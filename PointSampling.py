@@ -2,32 +2,194 @@
 """
 Created on Sun Oct 28 12:58:30 2018
 
-Handles sampling given numerical ranges.
+Handles sampling given numerical ranges. The samplers of an interval return
+sorted NumPy arrays, the samplers of a patch of collision space return a pair
+of arrays (theta, phi). Besides even spacing and uniform random sampling there
+are the low-discrepancy Halton and Sobol sequences, which cover a range evenly
+without the regular pattern of a grid, and stratified sampling, which puts one
+random point in each of a number of equal cells. In one dimension the Sobol
+sequence is the Halton sequence of base 2, so only the latter is offered
+for intervals.
 
 @author: Randy
 """
 import numpy as np
 
+# The number of bits of the Sobol sequence, enough for 2^32 points.
+SOBOLBITS = 32
+
 def evenSpacingSample(low, high, num):
     """ Samples evenly spaced points in the interval [low, high].
-        Returns num number of evenly spaced points in [low, high].
+        Returns num number of evenly spaced points in [low, high).
         USES NUMPY.
     """
-    return np.arange(low, high, (high-low)/float(num)).tolist()
+    step = (high-low)/float(num)
+    # Same values as np.arange(low, high, step), which can give one value
+    # too many through rounding, but always num of them.
+    return low + np.arange(num)*((low + step) - low)
 
-def randomSample(low, high, num):
+def randomSample(low, high, num, seed=None):
     """ 'Randomly' samples points in the interval [low, high].
         Returns num # of randomly sampled points in [low, high].
+        If seed is given the same points are returned on every call.
         USES NUMPY
     """
     # generate num random numbers between 0 and 1.
-    sample = np.random.rand(num)
+    sample = randomState(seed).rand(num)
     # find the range of numbers
     rangee = high - low
     # scale every number in the array by rangee
     sample = rangee*sample
     # shift the array of numbers into the interval [low, high]
     sample = sample + low
-    sample = sample.tolist()
     sample.sort()
-    return sample
\ No newline at end of file
+    return sample
+
+def haltonSample(low, high, num):
+    """ Samples the first num points of the Halton sequence (base 2) in the
+        interval [low, high]. The same points are returned on every call.
+        USES NUMPY
+    """
+    sample = low + (high - low)*radicalInverse(num, 2)
+    sample.sort()
+    return sample
+
+def stratifiedSample(low, high, num, seed=None):
+    """ Splits [low, high] into num equal cells and samples one point
+        uniformly at random in each cell. Returns the num points in order.
+        If seed is given the same points are returned on every call.
+        USES NUMPY
+    """
+    jitter = randomState(seed).rand(num)
+    return low + (np.arange(num) + jitter)*((high - low)/float(num))
+
+def randomSeeds(thetalow, thetahigh, philow, phihigh, num, seed=None):
+    """ 'Randomly' samples num points in the rectangle
+        [thetalow, thetahigh] x [philow, phihigh] of collision space.
+        Returns the pair of arrays (theta, phi).
+        If seed is given the same points are returned on every call.
+        USES NUMPY
+    """
+    generator = randomState(seed)
+    return (thetalow + (thetahigh - thetalow)*generator.rand(num), \
+            philow + (phihigh - philow)*generator.rand(num))
+
+def haltonSeeds(thetalow, thetahigh, philow, phihigh, num):
+    """ Samples the first num points of the Halton sequence (bases 2 and 3)
+        in the rectangle [thetalow, thetahigh] x [philow, phihigh] of
+        collision space. Returns the pair of arrays (theta, phi).
+        USES NUMPY
+    """
+    return (thetalow + (thetahigh - thetalow)*radicalInverse(num, 2), \
+            philow + (phihigh - philow)*radicalInverse(num, 3))
+
+def sobolSeeds(thetalow, thetahigh, philow, phihigh, num):
+    """ Samples the first num points of the 2D Sobol sequence in the
+        rectangle [thetalow, thetahigh] x [philow, phihigh] of collision
+        space. Returns the pair of arrays (theta, phi).
+        USES NUMPY
+    """
+    (u, v) = sobolPoints(num)
+    return (thetalow + (thetahigh - thetalow)*u, \
+            philow + (phihigh - philow)*v)
+
+def stratifiedSeeds(thetalow, thetahigh, thetanum, philow, phihigh, phinum, \
+                    seed=None):
+    """ Splits the rectangle [thetalow, thetahigh] x [philow, phihigh] of
+        collision space into thetanum by phinum equal cells and samples one
+        point uniformly at random in each cell. Returns the pair of arrays
+        (theta, phi), ordered like gridSeeds.
+        If seed is given the same points are returned on every call.
+        USES NUMPY
+    """
+    generator = randomState(seed)
+    (i, j) = np.meshgrid(np.arange(thetanum), np.arange(phinum), \
+                         indexing="ij")
+    theta = i.ravel() + generator.rand(i.size)
+    phi = j.ravel() + generator.rand(j.size)
+    return (thetalow + theta*((thetahigh - thetalow)/float(thetanum)), \
+            philow + phi*((phihigh - philow)/float(phinum)))
+
+def lineSeeds(thetastart, phistart, thetaend, phiend, num):
+    """ Samples evenly spaced points on the segment of collision space from
+        (thetastart, phistart) to (thetaend, phiend), both ends included.
+        Returns the pair of arrays (theta, phi), num values each.
+        USES NUMPY
+    """
+    t = np.linspace(0, 1, num)
+    return (thetastart + (thetaend - thetastart)*t, \
+            phistart + (phiend - phistart)*t)
+
+def gridSeeds(thetalow, thetahigh, thetanum, philow, phihigh, phinum):
+    """ Samples the points of an evenly spaced grid covering the rectangle
+        [thetalow, thetahigh] x [philow, phihigh] of collision space, with
+        thetanum values of theta and phinum values of phi, ends included.
+        Returns the pair of arrays (theta, phi), thetanum*phinum values each.
+        The points are ordered by theta first, then by phi.
+        USES NUMPY
+    """
+    (theta, phi) = np.meshgrid(np.linspace(thetalow, thetahigh, thetanum), \
+                               np.linspace(philow, phihigh, phinum), \
+                               indexing="ij")
+    return (theta.ravel(), phi.ravel())
+
+def diskSeeds(theta, phi, radius, num, seed=None):
+    """ 'Randomly' samples points in the disk of collision space with center
+        (theta, phi) and the given radius, uniformly by area. Points whose
+        phi falls outside [-pi/2, pi/2] are reflected back in.
+        Returns the pair of arrays (theta, phi), num values each.
+        If seed is given the same points are returned on every call.
+        USES NUMPY
+    """
+    generator = randomState(seed)
+    # The square root of a uniform number gives a uniform density in area.
+    r = radius*np.sqrt(generator.rand(num))
+    angle = 2*np.pi*generator.rand(num)
+    phis = phi + r*np.sin(angle)
+    phis = np.where(phis > np.pi/2, np.pi - phis, phis)
+    phis = np.where(phis < -np.pi/2, -np.pi - phis, phis)
+    return (theta + r*np.cos(angle), phis)
+
+def randomState(seed=None):
+    """ Returns the global NumPy random generator if seed is None, and a new
+        generator started from seed otherwise.
+    """
+    if seed is None:
+        return np.random
+    return np.random.RandomState(seed)
+
+def radicalInverse(num, base, start=0):
+    """ Returns the array of num points of the van der Corput sequence in the
+        given base, the Halton sequence of one dimension, skipping the first
+        'start' points. The i^th point is i+1 written in the base with its
+        digits mirrored about the point. All points are in (0, 1).
+    """
+    index = np.arange(start + 1, start + num + 1)
+    points = np.zeros(num)
+    scale = 1.0/base
+    while index.any():
+        points += scale*(index % base)
+        index //= base
+        scale /= base
+    return points
+
+def sobolPoints(num):
+    """ Returns the pair of arrays of the first num points of the 2D Sobol
+        sequence, starting with (0, 0). The first coordinate uses the
+        direction numbers 1/2, 1/4, 1/8, ... and the second those of the
+        primitive polynomial x + 1. All points are in [0, 1).
+    """
+    if num > 2**SOBOLBITS:
+        raise ValueError("The Sobol sequence has at most 2^" + \
+                         str(SOBOLBITS) + " points")
+    index = np.arange(num, dtype=np.uint64)
+    u = np.zeros(num, dtype=np.uint64)
+    v = np.zeros(num, dtype=np.uint64)
+    direction = 1 << (SOBOLBITS - 1)
+    for bit in range(SOBOLBITS):
+        # Points whose index has this bit set take its direction numbers.
+        has = ((index >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+        u[has] ^= np.uint64(1 << (SOBOLBITS - 1 - bit))
+        v[has] ^= np.uint64(direction)
+        direction ^= direction >> 1
+    return (u/float(2**SOBOLBITS), v/float(2**SOBOLBITS))
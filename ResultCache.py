@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Memoizes the trajectories computed by ComputeIteration.py so that a plot can
+be redrawn (different views, different first iteration) without iterating the
+collision map again. Keeps the most recently used results in memory and can
+also keep them in a directory of .npz files. Uses ComputeIteration.py and
+TrajectoryStore.py.
+"""
+import hashlib
+import os
+import zipfile
+from collections import OrderedDict
+from ComputeIteration import image_const_phi
+from ComputeIteration import image_const_theta
+from ComputeIteration import extendTrajectories
+from ComputeIteration import SEEDEDTYPES
+from TrajectoryStore import TrajectoryStore
+
+class ResultCache(object):
+    """ maxEntries := the number of results kept in memory. When it is
+                      exceeded the least recently used result is dropped.
+        directory  := optional directory where every result is also saved
+                      as a .npz file. Results found there are reused by later
+                      sessions.
+    """
+    def __init__(self, maxEntries=8, directory=None):
+        self.maxEntries = maxEntries
+        self.directory = directory
+        # Maps a key to its TrajectoryStore. The last entry is the most
+        # recently used one.
+        self.entries = OrderedDict()
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def image(self, const, sampleParamLow, sampleParamHi, samples, param, \
+              iterations, lam, sampleType, seed=None, workers=1):
+        """ Returns the TrajectoryStore computed by image_const_phi (const is
+            'phi') or image_const_theta (const is 'theta') for the given
+            arguments. The arguments have the same meaning as in
+            Plotter.plotter. A cached result is returned when there is one.
+            Random and stratified samples without a seed are never cached
+            because they are meant to change on every call.
+            The key does not hold the number of iterations. A cached result
+            with more iterations is cut short, one with fewer iterations is
+            extended with only the missing iterations. Adaptive samples are
+            the exception, their key holds the number of iterations.
+        """
+        key = (const, param, sampleParamLow, sampleParamHi, samples, lam, \
+               sampleType, seed)
+        if sampleType == 'adaptive':
+            # Adaptive seeds are chosen by their last images, so they change
+            # with the number of iterations.
+            key = key + (iterations,)
+        cacheable = not (sampleType in SEEDEDTYPES and seed is None)
+        if cacheable:
+            store = self.get(key)
+            if store is not None:
+                if store.iterations < iterations:
+                    extendTrajectories(store, iterations - store.iterations, \
+                                       workers)
+                    # Save the longer trajectories in place of the old ones.
+                    self.put(key, store)
+                return store.head(iterations)
+        if const == 'phi':
+            store = image_const_phi(sampleParamLow, sampleParamHi, samples, \
+                                    param, iterations, lam, sampleType, seed, \
+                                    workers)
+        elif const == 'theta':
+            store = image_const_theta(sampleParamLow, sampleParamHi, samples, \
+                                      param, iterations, lam, sampleType, \
+                                      seed, workers)
+        if cacheable:
+            self.put(key, store)
+        return store
+
+    def get(self, key):
+        """ Returns the TrajectoryStore saved under key or None if there is
+            none. Looks in memory first and then on disk. A file on disk
+            that cannot be read counts as none.
+        """
+        if key in self.entries:
+            # Move the entry to the end, it is now the most recently used.
+            store = self.entries.pop(key)
+            self.entries[key] = store
+            return store
+        path = self.path(key)
+        if path is not None and os.path.isfile(path):
+            # A file that cannot be read is a miss. The result is saved
+            # again once it has been computed.
+            if not zipfile.is_zipfile(path):
+                return None
+            try:
+                store = TrajectoryStore.load(path)
+            except (IOError, ValueError, KeyError, EOFError, \
+                    zipfile.BadZipfile):
+                return None
+            self.remember(key, store)
+            return store
+        return None
+
+    def put(self, key, store):
+        """ Saves store under key in memory and, if there is a directory, on
+            disk.
+        """
+        self.remember(key, store)
+        path = self.path(key)
+        if path is not None:
+            store.save(path)
+
+    def remember(self, key, store):
+        """ Keeps store in memory, dropping the least recently used entries
+            until there are at most maxEntries.
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = store
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def path(self, key):
+        """ Returns the name of the .npz file holding the result saved under
+            key, or None if there is no directory.
+        """
+        if self.directory is None:
+            return None
+        name = hashlib.sha1(repr(key)).hexdigest() + ".npz"
+        return os.path.join(self.directory, name)
+
+    def clear(self):
+        """ Forgets every result kept in memory. Files on disk are kept.
+        """
+        self.entries.clear()
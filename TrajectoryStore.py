@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Provides a compact container for the trajectories of an ensemble of sampled
+collision points. The collisions are kept in preallocated NumPy arrays both in
+Cartesian coordinates (x,y,beta) and in collision space coordinates
+(theta,phi). Ensembles too large for memory can be kept in files on disk
+instead, see MappedTrajectoryStore. Used by ComputeIteration.py and
+Plotter.py.
+"""
+import json
+import os
+import tempfile
+import numpy as np
+
+# The files of a MappedTrajectoryStore, inside its directory.
+MAPPEDCARTESIAN = "cartesian.dat"
+MAPPEDTHETAPHI = "thetaphi.dat"
+MAPPEDINFO = "store.json"
+
+class TrajectoryStore(object):
+    """ samples    := the number of sampled collision points.
+        iterations := the number of iterations of the collision map.
+        lam        := the parameter of the stadium the trajectories live in.
+                      Needed to extend the trajectories later on.
+        Holds the trajectories of 'samples' collision points. Each trajectory
+        is made of the initial collision followed by 'iterations' collisions.
+        cartesian := array of shape (samples, iterations+1, 3). The [i, j]
+                     entry is the (x,y,beta) of the j^th collision of the
+                     i^th sample.
+        thetaphi  := array of shape (samples, iterations+1, 2). The [i, j]
+                     entry is the (theta,phi) of the same collision.
+    """
+    def __init__(self, samples, iterations, lam=None):
+        self.lam = lam
+        self.cartesian = np.empty((samples, iterations + 1, 3))
+        self.thetaphi = np.empty((samples, iterations + 1, 2))
+
+    @property
+    def samples(self):
+        """ The number of sampled collision points.
+        """
+        return self.cartesian.shape[0]
+
+    @property
+    def iterations(self):
+        """ The number of iterations of the collision map. Not counting the
+            initial collisions.
+        """
+        return self.cartesian.shape[1] - 1
+
+    def iteration(self, k):
+        """ k := an iteration number or a slice of iteration numbers.
+            Returns the pair (cartesian, thetaphi) of arrays holding the k^th
+            collision of every sample. These are views, not copies.
+        """
+        return (self.cartesian[:, k], self.thetaphi[:, k])
+
+    def sample(self, i):
+        """ i := a sample number or a slice of sample numbers.
+            Returns the pair (cartesian, thetaphi) of arrays holding the
+            trajectory of the i^th sample. These are views, not copies.
+        """
+        return (self.cartesian[i], self.thetaphi[i])
+
+    def head(self, iterations):
+        """ Returns a TrajectoryStore holding only the initial collisions
+            and the first 'iterations' iterations. Its arrays are views of the
+            arrays of this store.
+        """
+        store = TrajectoryStore(0, 0, self.lam)
+        store.cartesian = self.cartesian[:, :iterations + 1]
+        store.thetaphi = self.thetaphi[:, :iterations + 1]
+        return store
+
+    def append(self, other):
+        """ other := a TrajectoryStore whose initial collisions are the last
+                     collisions of this store.
+            Appends the iterations of other to the trajectories of this store.
+            The initial collisions of other are not repeated.
+        """
+        self.cartesian = np.concatenate((self.cartesian, \
+                                         other.cartesian[:, 1:]), axis=1)
+        self.thetaphi = np.concatenate((self.thetaphi, \
+                                        other.thetaphi[:, 1:]), axis=1)
+
+    def insert(self, positions, other):
+        """ positions := array of sample numbers, see numpy.insert.
+            other     := a TrajectoryStore with one sample for every entry of
+                         positions and as many iterations as this store.
+            Inserts the trajectories of other before the given samples of
+            this store, so that the i^th sample of other ends up in front of
+            the sample that was number positions[i].
+        """
+        self.cartesian = np.insert(self.cartesian, positions, \
+                                   other.cartesian, axis=0)
+        self.thetaphi = np.insert(self.thetaphi, positions, \
+                                  other.thetaphi, axis=0)
+
+    def save(self, path):
+        """ Writes the trajectories to the .npz file 'path'. The file is
+            written under a temporary name first and renamed when it is
+            complete, so an interrupted save never leaves a partial file at
+            'path'.
+        """
+        if not path.endswith(".npz"):
+            path = path + ".npz"
+        # A store without lam is saved with lam = nan.
+        lam = np.nan if self.lam is None else self.lam
+        (handle, temporary) = tempfile.mkstemp(suffix=".tmp", \
+                                              dir=os.path.dirname(path) or ".")
+        try:
+            with os.fdopen(handle, "wb") as data:
+                np.savez(data, cartesian=self.cartesian, \
+                         thetaphi=self.thetaphi, lam=lam)
+            if os.name == "nt" and os.path.exists(path):
+                # Windows does not rename onto an existing file.
+                os.remove(path)
+            os.rename(temporary, path)
+        except:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    @staticmethod
+    def load(path):
+        """ Reads the trajectories written by save from the .npz file 'path'
+            and returns them as a new TrajectoryStore.
+        """
+        data = np.load(path)
+        store = TrajectoryStore(0, 0)
+        store.cartesian = data['cartesian']
+        store.thetaphi = data['thetaphi']
+        if 'lam' in data.files and not np.isnan(data['lam']):
+            store.lam = float(data['lam'])
+        data.close()
+        return store
+
+class MappedTrajectoryStore(TrajectoryStore):
+    """ directory := the directory holding the files of the store, made by
+                     MappedTrajectoryStore.create.
+        mode      := 'r+' to read and write the trajectories, 'r' to only
+                     read them.
+        A TrajectoryStore whose trajectories stay in files on disk and are
+        only read into memory when they are used, so the ensemble can be
+        larger than memory. The collisions are stored iteration by
+        iteration: all the collisions of iteration 0, then those of
+        iteration 1, and so on, as raw float64 values. Adding iterations
+        then only adds to the end of the files. The number of samples,
+        the number of iterations and lam are kept in a small json file.
+        cartesianFile := memory mapped array of shape (iterations+1,
+                         samples, 3). The [j, i] entry is the (x,y,beta) of
+                         the j^th collision of the i^th sample.
+        thetaphiFile  := memory mapped array of shape (iterations+1,
+                         samples, 2), the (theta,phi) of the same
+                         collisions.
+        cartesian and thetaphi are the same arrays with the first two axes
+        swapped, so the store can be used wherever a TrajectoryStore is.
+        Reading one iteration of every sample, as the views of Plotter.py
+        do, reads one contiguous block of the files.
+    """
+    def __init__(self, directory, mode="r+"):
+        self.directory = directory
+        self.mode = mode
+        with open(os.path.join(directory, MAPPEDINFO)) as info:
+            meta = json.load(info)
+        self.lam = meta["lam"]
+        self.mapFiles(meta["samples"], meta["iterations"])
+
+    @staticmethod
+    def create(directory, samples, iterations, lam=None):
+        """ Makes the files of a store of 'samples' trajectories with
+            'iterations' iterations in 'directory', which is made if needed,
+            and returns the store opened for reading and writing. The
+            collisions start out as zeros.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in (MAPPEDCARTESIAN, MAPPEDTHETAPHI):
+            open(os.path.join(directory, name), "wb").close()
+        MappedTrajectoryStore.resizeFiles(directory, samples, iterations, \
+                                          lam)
+        return MappedTrajectoryStore(directory)
+
+    @staticmethod
+    def resizeFiles(directory, samples, iterations, lam):
+        """ Sets the length of the files of the store in 'directory' to that
+            of 'iterations' iterations and writes its json file. Collisions
+            that are added read as zeros.
+        """
+        for (name, width) in ((MAPPEDCARTESIAN, 3), (MAPPEDTHETAPHI, 2)):
+            with open(os.path.join(directory, name), "r+b") as data:
+                data.truncate((iterations + 1)*samples*width* \
+                              np.dtype(np.float64).itemsize)
+        with open(os.path.join(directory, MAPPEDINFO), "w") as info:
+            json.dump({"samples": samples, "iterations": iterations, \
+                       "lam": lam}, info)
+
+    def mapFiles(self, samples, iterations):
+        """ Maps the files of the store into memory for the given shape.
+        """
+        self.cartesianFile = np.memmap(os.path.join(self.directory, \
+                                                    MAPPEDCARTESIAN), \
+                                       dtype=np.float64, mode=self.mode, \
+                                       shape=(iterations + 1, samples, 3))
+        self.thetaphiFile = np.memmap(os.path.join(self.directory, \
+                                                   MAPPEDTHETAPHI), \
+                                      dtype=np.float64, mode=self.mode, \
+                                      shape=(iterations + 1, samples, 2))
+        self.cartesian = self.cartesianFile.transpose(1, 0, 2)
+        self.thetaphi = self.thetaphiFile.transpose(1, 0, 2)
+
+    def resize(self, iterations):
+        """ Grows (or shrinks) the store to 'iterations' iterations. The
+            added collisions read as zeros until they are written.
+        """
+        if self.mode == "r":
+            raise ValueError("The store was opened read only")
+        samples = self.samples
+        self.flush()
+        # Let go of the old maps before the files change length.
+        self.cartesianFile = self.thetaphiFile = None
+        self.cartesian = self.thetaphi = None
+        MappedTrajectoryStore.resizeFiles(self.directory, samples, \
+                                          iterations, self.lam)
+        self.mapFiles(samples, iterations)
+
+    def append(self, other):
+        """ other := a TrajectoryStore whose initial collisions are the last
+                     collisions of this store.
+            Appends the iterations of other to the trajectories of this store
+            on disk. The initial collisions of other are not repeated.
+        """
+        old = self.iterations
+        self.resize(old + other.iterations)
+        self.cartesian[:, old + 1:] = other.cartesian[:, 1:]
+        self.thetaphi[:, old + 1:] = other.thetaphi[:, 1:]
+
+    def insert(self, positions, other):
+        """ Raises ValueError. The files are laid out iteration by iteration
+            so a new sample would move almost every collision on disk.
+        """
+        raise ValueError("Samples cannot be inserted into a " \
+                         "MappedTrajectoryStore")
+
+    def save(self, path):
+        """ Raises ValueError. The trajectories are already on disk, and an
+            .npz file would have to be built in memory.
+        """
+        raise ValueError("A MappedTrajectoryStore is already saved in " + \
+                         str(self.directory))
+
+    def flush(self):
+        """ Writes changes of the trajectories to disk.
+        """
+        if self.mode != "r":
+            self.cartesianFile.flush()
+            self.thetaphiFile.flush()